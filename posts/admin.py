@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post, Comment
 
 
@@ -9,6 +10,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по полнотекстовому индексу, а не LIKE по тексту.
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=search.search(search_term)), False
+
 
 class PostAdminGroup(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
@@ -0,0 +1,282 @@
+"""
+Кэш страниц с версионными ключами.
+
+Каждая страница зависит от набора "поколений" (scope): общей ленты,
+группы, профиля автора, ленты подписок пользователя. Номер поколения
+входит в ключ страницы, поэтому при изменении данных достаточно
+увеличить нужные поколения (см. posts.signals) - старые страницы
+больше не читаются и вытесняются по TTL, а свежие видны сразу.
+
+Поколение - не просто счётчик, а время последнего изменения в
+миллисекундах. Поэтому из поколений страницы без запросов к базе
+получаются валидаторы HTTP: ETag и Last-Modified, и на условный GET
+браузер получает 304, а view даже не вызывается.
+
+Сдвиг поколения видят все процессы только с общим кэшем. В кэше
+процесса (locmem) поколения истекают через GENERATION_TIMEOUT секунд:
+на столько страница и её валидаторы могут отстать от записи,
+сделанной другим процессом.
+"""
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from yatube.db.router import stale_read
+
+from .holes import fill_holes, punching
+
+GENERATION_KEY = "generation:{}"
+STATS_KEY = "cache_stats:{}:{}"
+
+# Обращение к кэшу страницы или фрагмента: name - префикс ключа,
+# hit - нашлась ли запись. На него подписаны метрики yatube.metrics.
+cache_accessed = Signal()
+
+
+def _initial_generation():
+    # Поколение, потерянное при вытеснении или истечении, начинается
+    # с текущего времени, а не с нуля, чтобы не совпасть со старым.
+    return int(time.time() * 1000)
+
+
+def generations(*scopes):
+    """Текущие номера поколений scopes (одним запросом к кэшу)."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _initial_generation(),
+                      settings.GENERATION_TIMEOUT)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def bump(*scopes):
+    """
+    Переводит scopes на новое поколение. Внутри транзакции поколения
+    сдвигаются ещё раз после COMMIT: страница, собранная другим
+    запросом до фиксации, иначе осталась бы в кэше под новым ключом.
+    """
+    keys = [GENERATION_KEY.format(scope) for scope in set(scopes)]
+    if not keys:
+        return
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys):
+    found = cache.get_many(keys)
+    now = _initial_generation()
+    # Гонка двух bump может потерять одно увеличение, но значение
+    # всё равно изменится, а для инвалидации важно только это.
+    # Новое поколение не меньше текущего времени и служит
+    # Last-Modified страниц.
+    cache.set_many({
+        key: max(found[key] + 1, now) if key in found else now
+        for key in keys
+    }, settings.GENERATION_TIMEOUT)
+
+
+def _key(prefix, key_parts):
+    raw_key = "|".join(map(str, key_parts))
+    return "{}:{}".format(prefix, hashlib.md5(raw_key.encode()).hexdigest())
+
+
+def _expired(entry, now):
+    """
+    Вероятностное раннее обновление (XFetch): чем дольше считается
+    значение и чем ближе конец его срока, тем вероятнее, что запрос
+    обновит его заранее, и записи не истекают у всех одновременно.
+    """
+    early = -entry["delta"] * settings.CACHE_EARLY_REFRESH_BETA * math.log(
+        1.0 - random.random())
+    return now + early >= entry["expires"]
+
+
+def get_or_compute(key, version, compute, timeout, cacheable=None):
+    """
+    Возвращает (значение, попадание) для key с защитой от лавины.
+
+    Запись хранит version; при её несовпадении или истечении срока
+    пересчитывает только запрос, взявший блокировку, остальные отдают
+    устаревшую копию (stale-while-revalidate). Если копии нет, они
+    ждут пересчёта не дольше CACHE_LOCK_WAIT секунд.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if (entry is not None and entry["version"] == version
+            and not _expired(entry, now)):
+        return entry["value"], True
+    lock_key = key + ":lock"
+    locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry["value"], True
+        deadline = now + settings.CACHE_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None and entry["version"] == version:
+                return entry["value"], True
+    try:
+        started = time.time()
+        value = compute()
+        if cacheable is None or cacheable(value):
+            finished = time.time()
+            cache.set(key, {
+                "version": version,
+                "value": value,
+                "expires": finished + timeout,
+                "delta": finished - started,
+            }, timeout + settings.CACHE_STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value, False
+
+
+def _cacheable_response(response):
+    return (response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not stale_read())
+
+
+def _validators(request, version):
+    """
+    ETag и Last-Modified (с точностью до секунды) для поколений
+    version. В ETag входит и CSRF-cookie: формы страницы несут
+    токен, который вход на сайт меняет.
+    """
+    etag = '"{}"'.format(hashlib.md5("|".join(map(str, (
+        request.get_full_path(), request.user.pk or 0,
+        request.META.get("CSRF_COOKIE", ""), *version,
+    ))).encode()).hexdigest())
+    return etag, max(version) // 1000
+
+
+def _conditional(request, version, respond):
+    """
+    304, если у клиента уже есть страница с поколениями version,
+    иначе ответ respond(). Оба несут ETag и Last-Modified.
+    """
+    etag, last_modified = _validators(request, version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+        # Страница с отстающей реплики старше поколений: с этими
+        # валидаторами клиент хранил бы её до следующего изменения.
+        if response.status_code != 200 or stale_read():
+            return response
+        # Пока страницу пересчитывает другой запрос, отдаётся прежняя
+        # копия - валидаторы берутся из её поколений. Токен CSRF мог
+        # появиться только при отрисовке.
+        etag, last_modified = _validators(
+            request, getattr(response, "generations", version))
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Каждый показ сверяется с сервером, а страницы пользователя
+    # не должны оседать в общих кэшах.
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional(scopes):
+    """
+    Условный GET для страницы, которая зависит от поколений
+    scopes(request, *args, **kwargs), но не кэшируется целиком.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            return _conditional(
+                request,
+                generations(*scopes(request, *args, **kwargs)),
+                lambda: view(request, *args, **kwargs),
+            )
+        return wrapper
+    return decorator
+
+
+def cache_versioned(timeout, key_prefix, scopes):
+    """
+    Замена cache_page: ответ кэшируется под ключом из адреса с
+    версией из поколений, которые возвращает
+    scopes(request, *args, **kwargs). Те же поколения дают
+    валидаторы условного GET. Копия одна на всех пользователей:
+    их части страницы заполняет posts.holes.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            key = _key(key_prefix, (request.get_full_path(),))
+            version = generations(*scopes(request, *args, **kwargs))
+
+            def compute():
+                with punching():
+                    response = view(request, *args, **kwargs)
+                response.generations = version
+                return response
+
+            def respond():
+                response, hit = get_or_compute(
+                    key, version, compute, timeout,
+                    cacheable=_cacheable_response,
+                )
+                cache_accessed.send(sender=None, name=key_prefix, hit=hit)
+                return fill_holes(response, request)
+            return _conditional(request, version, respond)
+        return wrapper
+    return decorator
+
+
+def record(name, hit):
+    """Считает попадания и промахи кэша name."""
+    cache_accessed.send(sender=None, name=name, hit=hit)
+    key = STATS_KEY.format(name, "hits" if hit else "misses")
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def stats(name):
+    hits = cache.get(STATS_KEY.format(name, "hits"), 0)
+    misses = cache.get(STATS_KEY.format(name, "misses"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def cached_fragment(name, key_parts, version, compute, timeout):
+    """
+    Кэширует результат compute() под ключом из name и key_parts
+    с версией version и ведёт счётчики попаданий для name.
+    Устаревшая копия, отданная во время пересчёта, считается
+    попаданием: база на такой запрос не тратится.
+    """
+    value, hit = get_or_compute(
+        _key(name, key_parts), version, compute, timeout)
+    record(name, hit)
+    return value
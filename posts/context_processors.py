@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def card_cache(request):
+    """
+    Срок кэша карточки поста для {% cache %} в post_item.html.
+    """
+    return {
+        'card_cache_timeout': settings.CARD_CACHE_TIMEOUT
+    }
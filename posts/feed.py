@@ -0,0 +1,193 @@
+"""
+Лента подписок с раздачей при записи (fan-out-on-write).
+
+Новый пост сразу раскладывается в FeedEntry каждого подписчика автора,
+поэтому чтение ленты не соединяет Post с Follow. Авторы, у которых
+подписчиков больше FEED_FANOUT_LIMIT, в таблицу не раздаются: их посты
+подмешиваются в ленту при чтении (fan-out-on-read), чтобы один пост
+не порождал миллионы вставок. Когда подписка или отписка переводит
+автора через этот порог, его записи убираются из лент или
+раскладываются заново. Записи удалённого поста уходят вместе с ним
+по CASCADE.
+
+FeedEntry хранит копию даты поста, и страница ленты берётся по
+индексу (user, -pub_date, -post) без сортировки (см. FeedPaginator).
+В ленте держится не больше FEED_MAX_ENTRIES последних постов: лишние
+убирает подписка и команда trim_feeds.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import AuthorStats, FeedEntry, Follow, Post
+from .paginator import CursorPaginator
+
+
+def is_celebrity(author):
+    return AuthorStats.objects.filter(
+        user=author,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).exists()
+
+
+def following_among(user, authors):
+    """Множество id авторов из authors, на которых подписан user."""
+    if not user.is_authenticated:
+        return set()
+    return set(Follow.objects.filter(
+        user=user,
+        author__in=authors,
+    ).values_list("author_id", flat=True))
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author=post.author_id,
+    ).values_list("user_id", flat=True).iterator()
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты автора."""
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author=author_id).order_by(
+        "-pub_date",
+    ).values_list("pk", "pub_date")[:settings.FEED_BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def trim(user_id):
+    """Оставляет в ленте user_id не больше FEED_MAX_ENTRIES постов."""
+    last = FeedEntry.objects.filter(user=user_id).order_by(
+        "-pub_date", "-post_id",
+    ).values_list("pub_date", flat=True)[
+        settings.FEED_MAX_ENTRIES - 1:settings.FEED_MAX_ENTRIES]
+    for pub_date in last:
+        FeedEntry.objects.filter(user=user_id, pub_date__lt=pub_date).delete()
+
+
+def trim_all():
+    """Обрезает переполненные ленты; возвращает их количество."""
+    users = list(FeedEntry.objects.values("user").annotate(
+        entries=Count("pk"),
+    ).filter(
+        entries__gt=settings.FEED_MAX_ENTRIES,
+    ).values_list("user", flat=True).order_by())
+    for user_id in users:
+        trim(user_id)
+    return len(users)
+
+
+def _fan_out_author(author_id):
+    """
+    Один INSERT ... SELECT раздаёт последние посты автора всем его
+    подписчикам прямо в базе, без создания объектов в Python.
+    """
+    sql = (
+        f"INSERT INTO {FeedEntry._meta.db_table} (user_id, post_id, pub_date) "
+        f"SELECT follow.user_id, post.id, post.pub_date "
+        f"FROM {Follow._meta.db_table} AS follow, ("
+        f"  SELECT id, pub_date FROM {Post._meta.db_table}"
+        f"  WHERE author_id = %s"
+        f"  ORDER BY pub_date DESC LIMIT %s"
+        f") AS post "
+        f"WHERE follow.author_id = %s AND NOT EXISTS ("
+        f"  SELECT 1 FROM {FeedEntry._meta.db_table} AS entry"
+        f"  WHERE entry.user_id = follow.user_id AND entry.post_id = post.id"
+        f")"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            sql, [author_id, settings.FEED_BACKFILL_LIMIT, author_id])
+
+
+def rebuild():
+    """Заново раскладывает ленты по текущим подпискам, автор за автором."""
+    FeedEntry.objects.all().delete()
+    authors = Follow.objects.exclude(
+        author__stats__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list("author_id", flat=True).distinct().order_by()
+    for author_id in list(authors.iterator()):
+        _fan_out_author(author_id)
+    trim_all()
+
+
+def followers_changed(author_id, delta):
+    """
+    Переводит автора между раздачей при записи и при чтении, если
+    подписка (delta=1) или отписка (delta=-1) перевела число его
+    подписчиков через FEED_FANOUT_LIMIT. Ставшего знаменитостью
+    автора убирает из лент, переставшего - раскладывает заново.
+    Возвращает True при переходе.
+    """
+    followers = AuthorStats.objects.filter(user=author_id).values_list(
+        "followers_count", flat=True,
+    ).first()
+    if delta > 0 and followers == settings.FEED_FANOUT_LIMIT + 1:
+        FeedEntry.objects.filter(post__author=author_id).delete()
+    elif delta < 0 and followers == settings.FEED_FANOUT_LIMIT:
+        _fan_out_author(author_id)
+    else:
+        return False
+    return True
+
+
+def purge(user_id, author_id):
+    """Убирает посты автора из ленты бывшего подписчика."""
+    FeedEntry.objects.filter(
+        user=user_id,
+        post__author=author_id,
+    ).delete()
+
+
+def celebrities_followed_by(user):
+    """Авторы из подписок user, которых читают при запросе ленты."""
+    return Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values("author")
+
+
+class FeedPaginator(CursorPaginator):
+    """
+    Лента подписок user по ключу (-pub_date, -id). Разложенные посты
+    читаются из FeedEntry по индексу ленты, посты знаменитостей
+    celebrities (id авторов) - по индексу автора; ключи сливаются,
+    и посты страницы выбираются по pk одним запросом.
+    """
+
+    def __init__(self, user, per_page, celebrities=()):
+        super().__init__(
+            Post.objects.select_related("author", "group"), per_page)
+        self.user = user
+        self.celebrities = list(celebrities)
+
+    def fetch(self, values, descending, inclusive, limit):
+        entries = self._slice(
+            FeedEntry.objects.filter(user=self.user),
+            values, descending, inclusive, fields=("pub_date", "post_id"),
+        ).values_list("pub_date", "post_id")
+        keys = set(entries[:limit])
+        if self.celebrities:
+            keys.update(self._slice(
+                Post.objects.filter(author__in=self.celebrities),
+                values, descending, inclusive,
+            ).values_list("pub_date", "id")[:limit])
+        keys = sorted(keys, reverse=descending)[:limit]
+        posts = self.object_list.in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
@@ -1,9 +1,32 @@
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 
+from . import images
 from .models import Post, Comment
 
 
+class BoundedImageField(forms.ImageField):
+    def to_python(self, data):
+        if data is not None and (
+                getattr(data, 'too_large', False)
+                or data.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE):
+            raise forms.ValidationError(
+                'Файл больше %(limit)s.',
+                code='too_large',
+                params={'limit': filesizeformat(
+                    settings.POST_IMAGE_MAX_UPLOAD_SIZE)},
+            )
+        return super().to_python(data)
+
+
 class PostForm(forms.ModelForm):
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if image and 'image' in self.changed_data:
+            return images.ingest(image)
+        return image
+
     class Meta:
         model = Post
         fields = (
@@ -20,6 +43,9 @@ class PostForm(forms.ModelForm):
             'text': 'Можешь здесь писать все, что хочешь :)',
             'group': 'Группу выбирать не обязательно',
         }
+        field_classes = {
+            'image': BoundedImageField,
+        }
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,152 @@
+"""
+Группы: кэш slug -> группа и счётчики каталога.
+
+Страница группы ищет её по slug в памяти процесса. Запись живёт
+GROUP_CACHE_TIMEOUT секунд и сверяется с поколением "group_slugs",
+которое сдвигают сигналы Group: с общим кэшем изменение группы видят
+все процессы сразу, а с locmem - не позже, чем истечёт поколение
+(GENERATION_TIMEOUT).
+
+GroupStats меняются на F() при записи постов (record_post), без
+агрегатов на запрос. Число записей за неделю - сумма дневных
+GroupActivity за GROUP_ACTIVITY_DAYS дней. Окно сдвигается первым за
+день показом каталога или записью поста в группу (roll_daily), а
+старые дни удаляются, так что в остальные запросы каталог ничего не
+пересчитывает.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.http import Http404
+from django.utils import timezone
+
+from .cache import bump, generations
+from .models import Group, GroupActivity, GroupStats, Post
+
+ROLLED_KEY = "group_activity_rolled:{}"
+
+_slugs = {}
+_slugs_lock = threading.Lock()
+
+
+def group_by_slug(slug):
+    """Группа по slug из кэша процесса; Http404, если её нет."""
+    generation = generations("group_slugs")
+    entry = _slugs.get(slug)
+    if (entry is not None and entry[1] == generation
+            and entry[2] > time.monotonic()):
+        return entry[0]
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        raise Http404("Группа не найдена")
+    with _slugs_lock:
+        _slugs[slug] = (
+            group, generation,
+            time.monotonic() + settings.GROUP_CACHE_TIMEOUT,
+        )
+    return group
+
+
+def window_start(today=None):
+    """Первый день окна активности."""
+    today = today or timezone.localdate()
+    return today - timedelta(days=settings.GROUP_ACTIVITY_DAYS - 1)
+
+
+def record_post(group_id, pub_date, delta):
+    """Учитывает появление (+1) или исчезновение (-1) поста группы."""
+    roll_daily()
+    day = timezone.localdate(pub_date)
+    changes = {"posts_count": Greatest(F("posts_count") + delta, 0)}
+    if day >= window_start():
+        changes["recent_posts"] = Greatest(F("recent_posts") + delta, 0)
+        activity = GroupActivity.objects.filter(group=group_id, day=day)
+        if not activity.update(
+                posts_count=Greatest(F("posts_count") + delta, 0)
+        ) and delta > 0:
+            try:
+                with transaction.atomic():
+                    GroupActivity.objects.create(
+                        group_id=group_id, day=day, posts_count=delta)
+            except IntegrityError:
+                activity.update(posts_count=F("posts_count") + delta)
+    if delta > 0:
+        moment = Value(pub_date, output_field=DateTimeField())
+        changes["last_post_at"] = Greatest(
+            Coalesce("last_post_at", moment), moment)
+    stats = GroupStats.objects.filter(group=group_id)
+    stats.update(**changes)
+    if delta < 0:
+        # Удалили последнюю запись: время берём у предыдущей.
+        stats.filter(last_post_at__lte=pub_date).update(
+            last_post_at=Subquery(Post.objects.filter(
+                group=group_id).order_by("-pub_date").values(
+                "pub_date")[:1]))
+    bump("groups")
+
+
+def _recent_posts(since):
+    return Coalesce(Subquery(
+        GroupActivity.objects.filter(
+            group=OuterRef("group"), day__gte=since,
+        ).values("group").annotate(total=Sum("posts_count")).values("total")
+    ), 0)
+
+
+def roll_activity():
+    """Сдвигает окно активности на сегодня и удаляет старые дни."""
+    since = window_start()
+    with transaction.atomic():
+        GroupStats.objects.update(recent_posts=_recent_posts(since))
+        GroupActivity.objects.filter(day__lt=since).delete()
+    bump("groups")
+
+
+def roll_daily():
+    """roll_activity не чаще раза в день на все процессы."""
+    today = timezone.localdate()
+    if cache.add(ROLLED_KEY.format(today), 1, 2 * 24 * 60 * 60):
+        roll_activity()
+
+
+def rebuild():
+    """Пересчитывает GroupStats и GroupActivity по таблице постов."""
+    since = window_start()
+    with transaction.atomic():
+        GroupStats.objects.bulk_create(
+            (GroupStats(group_id=pk) for pk in Group.objects.filter(
+                stats__isnull=True,
+            ).values_list("pk", flat=True).iterator()),
+            batch_size=1000,
+        )
+        GroupActivity.objects.all().delete()
+        days = Post.objects.filter(
+            group__isnull=False,
+            pub_date__date__gte=since,
+        ).annotate(day=TruncDate("pub_date")).values(
+            "group", "day").annotate(total=Count("pk")).order_by()
+        GroupActivity.objects.bulk_create(
+            (GroupActivity(group_id=row["group"], day=row["day"],
+                           posts_count=row["total"])
+             for row in days.iterator()),
+            batch_size=1000,
+        )
+        posts = Post.objects.filter(group=OuterRef("group"))
+        updated = GroupStats.objects.update(
+            posts_count=Coalesce(Subquery(
+                posts.values("group").annotate(
+                    total=Count("pk")).values("total")), 0),
+            last_post_at=Subquery(posts.values("group").annotate(
+                last=Max("pub_date")).values("last")),
+            recent_posts=_recent_posts(since),
+        )
+    bump("groups")
+    return updated
@@ -0,0 +1,121 @@
+"""
+Общие для всех пользователей страницы с "дырками".
+
+cache_versioned кэширует одну копию страницы на адрес, а не на
+пользователя. Пока она собирается (punching), теги {% hole %} и
+{% viewer %} (posts.templatetags.holes) выводят вместо частей, которые
+зависят от пользователя, метки:
+
+- <!--hole:вид:id-->...<!--/hole--> - блок показывается или убирается:
+  auth и anon - по входу на сайт, owner - только автору id,
+  following и not_following - по подписке на автора id (себе самому
+  не показываются);
+- <!--viewer:имя--> - имя пользователя (username) или адрес его
+  профиля (profile_url).
+
+fill_holes перед отдачей страницы заполняет метки для пользователя
+запроса: один проход регулярным выражением и, если на странице есть
+кнопки подписки, один запрос к Follow. Блоки не вкладываются друг в
+друга. Вне punching теги сразу выводят нужный вариант. Подделать
+метку текстом поста нельзя: шаблоны экранируют "<".
+"""
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.urls import reverse
+from django.utils.html import escape
+
+from .feed import following_among
+
+HOLE_RE = re.compile(r"<!--hole:(\w+):(\d*)-->(.*?)<!--/hole-->", re.S)
+VIEWER_RE = re.compile(r"<!--viewer:(\w+)-->")
+FOLLOW_KINDS = ("following", "not_following")
+
+_punching = ContextVar("punching_holes", default=False)
+
+
+@contextmanager
+def punching():
+    """Страница собирается одна на всех: теги выводят метки."""
+    token = _punching.set(True)
+    try:
+        yield
+    finally:
+        _punching.reset(token)
+
+
+def is_punching():
+    return _punching.get()
+
+
+def hole(kind, arg, content):
+    return "<!--hole:{}:{}-->{}<!--/hole-->".format(
+        kind, "" if arg is None else arg, content)
+
+
+def visible(kind, arg, user, following):
+    """
+    Виден ли блок kind с аргументом arg пользователю user;
+    following - множество id авторов, на которых он подписан.
+    """
+    if kind == "auth":
+        return user.is_authenticated
+    if kind == "anon":
+        return not user.is_authenticated
+    if kind == "owner":
+        return user.pk == arg
+    if kind in FOLLOW_KINDS:
+        return user.pk != arg and (arg in following) == (
+            kind == "following")
+    raise ValueError(f"Неизвестный вид блока: {kind}")
+
+
+def follows(request, author):
+    """Подписан ли пользователь запроса на author; один запрос на автора."""
+    known = request.__dict__.setdefault("_holes_follows", {})
+    if author not in known:
+        known[author] = author in following_among(request.user, [author])
+    return known[author]
+
+
+def viewer(name, user):
+    if not user.is_authenticated:
+        return ""
+    if name == "username":
+        return escape(user.username)
+    if name == "profile_url":
+        return reverse("profile", args=[user.username])
+    raise ValueError(f"Неизвестное значение пользователя: {name}")
+
+
+def fill_holes(response, request):
+    """Заполняет метки общей страницы response для request.user."""
+    if response.streaming or not response.get(
+            "Content-Type", "").startswith("text/html"):
+        return response
+    content = response.content.decode(response.charset)
+    user = request.user
+    authors = {
+        int(arg) for kind, arg, _ in HOLE_RE.findall(content)
+        if kind in FOLLOW_KINDS
+    }
+    following = following_among(user, authors) if authors else set()
+    content = HOLE_RE.sub(
+        lambda match: match.group(3) if visible(
+            match.group(1),
+            int(match.group(2)) if match.group(2) else None,
+            user,
+            following,
+        ) else "",
+        content,
+    )
+    values = {}
+
+    def value(match):
+        name = match.group(1)
+        if name not in values:
+            values[name] = viewer(name, user)
+        return values[name]
+    response.content = VIEWER_RE.sub(value, content)
+    return response
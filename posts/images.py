@@ -0,0 +1,56 @@
+"""
+Приём картинок постов: оригинал загрузки не хранится.
+
+Картинка уменьшается до POST_IMAGE_MAX_SIZE, перекодируется в первый
+поддерживаемый Pillow формат из POST_IMAGE_FORMATS и сохраняется без
+метаданных (EXIF, GPS). Слишком большие по числу пикселей картинки
+отклоняются до декодирования - по размерам из заголовка.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+EXTENSIONS = {
+    "AVIF": ".avif",
+    "WEBP": ".webp",
+    "JPEG": ".jpg",
+}
+
+
+def output_format():
+    Image.init()
+    for name in settings.POST_IMAGE_FORMATS:
+        if name in Image.SAVE:
+            return name
+    return "JPEG"
+
+
+def ingest(upload):
+    """Возвращает уменьшенную и перекодированную копию upload."""
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                "Слишком большое изображение: %(width)s×%(height)s.",
+                code="too_many_pixels",
+                params={"width": width, "height": height},
+            )
+        # Для JPEG draft декодирует сразу в уменьшенном масштабе.
+        image.draft("RGB", settings.POST_IMAGE_MAX_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(settings.POST_IMAGE_MAX_SIZE, Image.LANCZOS)
+        fmt = output_format()
+        has_alpha = image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info)
+        mode = "RGBA" if has_alpha and fmt != "JPEG" else "RGB"
+        if image.mode != mode:
+            image = image.convert(mode)
+        output = BytesIO()
+        image.save(output, fmt, quality=settings.POST_IMAGE_QUALITY)
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(output.getvalue(), name=stem + EXTENSIONS[fmt])
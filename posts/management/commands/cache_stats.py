@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import stats
+
+
+class Command(BaseCommand):
+    help = "Показывает попадания и промахи кэшей фрагментов."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", default=["follow_feed"])
+
+    def handle(self, *args, **options):
+        for name in options["names"]:
+            result = stats(name)
+            self.stdout.write(
+                "{}: попаданий {hits}, промахов {misses}, "
+                "доля попаданий {hit_ratio:.1%}".format(name, **result)
+            )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import AuthorStats, Follow, Post, User
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef("pk")},
+        ).values(field).annotate(total=Count("pk")).values("total")
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает AuthorStats по таблицам постов и подписок."
+
+    def handle(self, *args, **options):
+        AuthorStats.objects.bulk_create(
+            (AuthorStats(user_id=pk) for pk in User.objects.filter(
+                stats__isnull=True,
+            ).values_list("pk", flat=True).iterator()),
+            batch_size=1000,
+        )
+        updated = AuthorStats.objects.update(
+            posts_count=count_of(Post, "author"),
+            followers_count=count_of(Follow, "author"),
+            following_count=count_of(Follow, "user"),
+        )
+        self.stdout.write(f"Пересчитано авторов: {updated}")
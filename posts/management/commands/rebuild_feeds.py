@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = "Заново раскладывает ленты подписок по таблице FeedEntry."
+
+    def handle(self, *args, **options):
+        feed.rebuild()
+        self.stdout.write(f"Записей в лентах: {FeedEntry.objects.count()}")
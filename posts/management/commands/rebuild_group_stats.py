@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import groups
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает GroupStats и дневную активность групп "
+        "по таблице постов."
+    )
+
+    def handle(self, *args, **options):
+        updated = groups.rebuild()
+        self.stdout.write(f"Пересчитано групп: {updated}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Заново строит поисковый индекс постов."
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(
+            f"Проиндексировано постов: {count} "
+            f"(индекс: {search.get_index().name})")
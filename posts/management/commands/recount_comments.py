@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает Post.comments_count по таблице комментариев."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, сколько счётчиков разошлось.",
+        )
+
+    def handle(self, *args, **options):
+        actual = Coalesce(Subquery(
+            Comment.objects.filter(
+                post=OuterRef("pk"),
+            ).values("post").annotate(total=Count("pk")).values("total")
+        ), 0)
+        broken = Post.objects.annotate(actual=actual).exclude(
+            comments_count=F("actual"),
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Расхождений: {broken.count()}")
+            return
+        fixed = Post.objects.filter(
+            pk__in=broken.values("pk"),
+        ).update(comments_count=actual, version=F("version") + 1)
+        self.stdout.write(f"Исправлено счётчиков: {fixed}")
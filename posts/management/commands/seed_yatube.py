@@ -0,0 +1,220 @@
+import contextlib
+import itertools
+import random
+import time
+from array import array
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    "кот книга город море утро вечер дорога друг музыка фильм лес река "
+    "работа отпуск кофе дождь солнце зима лето осень весна поезд горы "
+    "история идея проект код задача решение вопрос ответ новость день "
+    "хороший новый старый быстрый тихий светлый любимый большой первый "
+    "читать писать смотреть гулять думать ехать слушать готовить учить"
+).split()
+
+
+class Zipf:
+    """
+    Номер из range(size) с вероятностью ~ 1 / (номер + 1) ** exponent.
+    Обратная функция непрерывного приближения не требует таблицы весов
+    на миллионы строк.
+    """
+
+    def __init__(self, size, exponent=1.0):
+        self.size = size
+        self.exponent = exponent
+
+    def __call__(self, rnd):
+        uniform = rnd.random()
+        if self.exponent == 1:
+            value = (self.size + 1) ** uniform
+        else:
+            power = 1 - self.exponent
+            value = (((self.size + 1) ** power - 1) * uniform + 1) ** (
+                1 / power)
+        return min(int(value) - 1, self.size - 1)
+
+
+@contextlib.contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы даты можно было задать самим."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными: пользователи, группы, "
+        "посты с популярностью авторов по закону Ципфа, комментарии и "
+        "граф подписок со степенным распределением. Строки пишутся "
+        "пачками bulk_create в обход сигналов, после чего счётчики, "
+        "ленты и поисковый индекс пересчитываются целиком."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument(
+            "--follows", type=int, default=20,
+            help="Среднее число подписок одного пользователя.")
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="За сколько дней до сегодня распределить посты.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--skip-derived", action="store_true",
+            help="Не пересчитывать счётчики, ленты и поисковый индекс.")
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        users = self.create_users(options["users"])
+        groups = self.create_groups(options["groups"])
+        post_ids, post_date = self.create_posts(
+            options["posts"], users, groups, options["days"])
+        self.create_comments(options["comments"], users, post_ids,
+                             post_date)
+        self.create_follows(options["follows"], users)
+        if not options["skip_derived"]:
+            for command in ("recount_comments", "rebuild_author_stats",
+                            "rebuild_feeds", "rebuild_search_index",
+                            "rebuild_group_stats"):
+                self.timed(command, call_command, command,
+                           stdout=self.stdout)
+
+    def timed(self, label, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.stdout.write(
+            f"{label}: {time.perf_counter() - started:.1f} с")
+        return result
+
+    def bulk(self, model, rows):
+        """Пишет строки пачками; возвращает id новых строк по порядку."""
+        last_pk = model.objects.order_by("-pk").values_list(
+            "pk", flat=True).first() or 0
+        count = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            count += len(batch)
+            self.stdout.write(
+                f"\r{model._meta.verbose_name_plural}: {count}", ending="")
+        self.stdout.write("")
+        # SQLite не возвращает ключи из bulk_create, поэтому новые
+        # строки находим по росту первичного ключа.
+        return array("q", model.objects.filter(pk__gt=last_pk).order_by(
+            "pk").values_list("pk", flat=True).iterator())
+
+    def create_users(self, count):
+        start = User.objects.count()
+        return self.timed("Пользователи", self.bulk, User, (
+            User(username=f"seed{start + number}", password="!")
+            for number in range(count)))
+
+    def create_groups(self, count):
+        start = Group.objects.count()
+        return self.timed("Группы", self.bulk, Group, (
+            Group(title=f"Сообщество {start + number}",
+                  slug=f"seed-{start + number}",
+                  description=self.text(20))
+            for number in range(count)))
+
+    def text(self, length):
+        return " ".join(self.rnd.choices(WORDS, k=length)).capitalize()
+
+    def create_posts(self, count, users, groups, days):
+        """Посты идут по возрастанию даты, как при настоящей работе."""
+        author = Zipf(len(users))
+        group = Zipf(len(groups)) if groups else None
+        started = timezone.now() - timedelta(days=days)
+        step = timedelta(days=days) / max(count, 1)
+
+        def post_date(number):
+            return started + step * number
+
+        def rows():
+            for number in range(count):
+                yield Post(
+                    author_id=users[author(self.rnd)],
+                    group_id=(groups[group(self.rnd)]
+                              if group and self.rnd.random() < 0.5
+                              else None),
+                    text=self.text(self.rnd.randint(5, 60)),
+                    pub_date=post_date(number),
+                )
+
+        with explicit_dates(Post._meta.get_field("pub_date")):
+            ids = self.timed("Посты", self.bulk, Post, rows())
+        return ids, post_date
+
+    def create_comments(self, count, users, post_ids, post_date):
+        if not post_ids:
+            return
+        # Больше всего обсуждают свежие посты.
+        post = Zipf(len(post_ids), exponent=0.8)
+        now = timezone.now()
+
+        def rows():
+            for _ in range(count):
+                index = len(post_ids) - 1 - post(self.rnd)
+                created = post_date(index) + timedelta(
+                    minutes=self.rnd.expovariate(1 / 120))
+                yield Comment(
+                    post_id=post_ids[index],
+                    author_id=self.rnd.choice(users),
+                    text=self.text(self.rnd.randint(3, 25)),
+                    created=min(created, now),
+                )
+
+        with explicit_dates(Comment._meta.get_field("created")):
+            self.timed("Комментарии", self.bulk, Comment, rows())
+
+    def create_follows(self, average, users):
+        """
+        Число подписок пользователя распределено по Парето, а выбор
+        авторов - по Ципфу: у немногих авторов огромная аудитория.
+        """
+        if len(users) < 2:
+            return
+        alpha = 1.5
+        author = Zipf(len(users))
+        mean = alpha / (alpha - 1)
+
+        def rows():
+            for user in users:
+                degree = min(
+                    len(users) - 1,
+                    int(average / mean * self.rnd.paretovariate(alpha)),
+                )
+                authors = set()
+                for _ in range(degree * 3):
+                    if len(authors) >= degree:
+                        break
+                    candidate = users[author(self.rnd)]
+                    if candidate != user:
+                        authors.add(candidate)
+                for author_id in authors:
+                    yield Follow(user_id=user, author_id=author_id)
+
+        self.timed("Подписки", self.bulk, Follow, rows())
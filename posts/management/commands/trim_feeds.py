@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Убирает из лент подписок посты старше FEED_MAX_ENTRIES "
+        "последних."
+    )
+
+    def handle(self, *args, **options):
+        trimmed = feed.trim_all()
+        self.stdout.write(f"Обрезано лент: {trimmed}")
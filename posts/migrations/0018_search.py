@@ -0,0 +1,64 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.utils import OperationalError
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_fts(schema_editor):
+    """Создаёт таблицу FTS5, если база - SQLite, собранный с FTS5."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    try:
+        # remove_diacritics 0: основы уже нормализованы, а без него
+        # токенизатор склеил бы "й" с "и".
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"body, tokenize = 'unicode61 remove_diacritics 0')"
+        )
+    except OperationalError:
+        return False
+    return True
+
+
+def create_index(apps, schema_editor):
+    # Индекс здесь не заполняется: токенизатор posts.search со
+    # стеммером и стоп-словами меняется вместе с кодом, а миграция
+    # должна давать один результат. Посты, которые уже есть в базе,
+    # индексирует команда rebuild_search_index.
+    create_fts(schema_editor)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа слова')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Число вхождений')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='posts.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_post_term'),
+        ),
+        migrations.RunPython(create_index, drop_fts),
+    ]
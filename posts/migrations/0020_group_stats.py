@@ -0,0 +1,87 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:29
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def fill_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupActivity = apps.get_model('posts', 'GroupActivity')
+    Post = apps.get_model('posts', 'Post')
+    since = timezone.localdate() - timedelta(
+        days=settings.GROUP_ACTIVITY_DAYS - 1)
+    days = Post.objects.filter(
+        group__isnull=False, pub_date__date__gte=since,
+    ).annotate(day=TruncDate('pub_date')).values(
+        'group', 'day').annotate(total=Count('pk')).order_by()
+    GroupActivity.objects.bulk_create(
+        (GroupActivity(group_id=row['group'], day=row['day'],
+                       posts_count=row['total'])
+         for row in days.iterator()),
+        batch_size=1000,
+    )
+    posts = Post.objects.filter(group=OuterRef('pk')).values('group')
+    recent = GroupActivity.objects.filter(group=OuterRef('pk')).values(
+        'group')
+    groups = Group.objects.annotate(
+        posts_count=Coalesce(Subquery(posts.annotate(
+            total=Count('pk')).values('total')), 0),
+        last_post_at=Subquery(posts.annotate(
+            last=Max('pub_date')).values('last')),
+        recent_posts=Coalesce(Subquery(recent.annotate(
+            total=Sum('posts_count')).values('total')), 0),
+    ).values_list('pk', 'posts_count', 'last_post_at', 'recent_posts')
+    GroupStats.objects.bulk_create(
+        (GroupStats(group_id=pk, posts_count=count, last_post_at=last,
+                    recent_posts=recent_count)
+         for pk, count, last, recent_count in groups.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_feed_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('last_post_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя запись')),
+                ('recent_posts', models.PositiveIntegerField(default=0, verbose_name='Записей за неделю')),
+            ],
+            options={
+                'verbose_name': 'Статистика группы',
+                'verbose_name_plural': 'Статистика групп',
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='posts.group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Активность группы',
+                'verbose_name_plural': 'Активность групп',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='groupactivity',
+            constraint=models.UniqueConstraint(fields=('group', 'day'), name='unique_group_day'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import F
 
 User = get_user_model()
 
@@ -57,15 +58,55 @@ class Post(models.Model):
         verbose_name="Картинка",
         blank=True,
     )
+    thumbnails = models.JSONField(
+        verbose_name="Миниатюры",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name="Количество комментариев",
+        default=0,
+        editable=False,
+    )
+    # Входит в ключ кэша карточки (includes/post_item.html): растёт
+    # со всем, что карточка показывает.
+    version = models.PositiveIntegerField(
+        verbose_name="Версия",
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ("-pub_date",)
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # Ленты автора и группы: фильтр по внешнему ключу и порядок
+        # CursorPaginator по (-pub_date, -id) без сортировки в памяти.
+        indexes = [
+            models.Index(fields=["author", "-pub_date", "-id"],
+                         name="post_author_pub_date_idx"),
+            models.Index(fields=["group", "-pub_date", "-id"],
+                         name="post_group_pub_date_idx"),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if self.pk is None or kwargs.get("force_insert"):
+            return super().save(*args, **kwargs)
+        # Версия растёт в самой базе (version = version + 1): сдвиг F()
+        # из другого запроса не теряется. Новое значение читается из
+        # базы при первом обращении к полю.
+        self.version = F("version") + 1
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            del self.version
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -90,6 +131,12 @@ class Comment(models.Model):
         ordering = ("-created",)
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        # Комментарии поста идут страницами CursorPaginator
+        # по (-created, -id).
+        indexes = [
+            models.Index(fields=["post", "-created", "-id"],
+                         name="comment_post_created_idx"),
+        ]
 
 
 class Follow(models.Model):
@@ -111,3 +158,154 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=["user", "author"],
                                     name="unique_follow"),
         ]
+        # unique_follow начинается с user, а подписчиков автора ищут
+        # по author.
+        indexes = [
+            models.Index(fields=["author", "user"],
+                         name="follow_author_user_idx"),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Подписчик",
+        related_name="feed_entries",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name="Пост",
+        related_name="feed_entries",
+    )
+    # Копия Post.pub_date: лента читается по индексу без соединения.
+    pub_date = models.DateTimeField(
+        verbose_name="Дата публикации",
+    )
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"],
+                                    name="unique_feed_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"],
+                         name="feed_user_pub_date_idx"),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счётчики автора, которые поддерживают сигналы Post и Follow."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Автор",
+        related_name="stats",
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name="Записей",
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков",
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name="Подписок",
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+
+
+class GroupStats(models.Model):
+    """
+    Счётчики группы для каталога, которые поддерживают сигналы Post:
+    всего записей, время последней и записи за последние
+    GROUP_ACTIVITY_DAYS дней (сумма дневных GroupActivity).
+    """
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Группа",
+        related_name="stats",
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name="Записей",
+        default=0,
+    )
+    last_post_at = models.DateTimeField(
+        verbose_name="Последняя запись",
+        blank=True,
+        null=True,
+    )
+    recent_posts = models.PositiveIntegerField(
+        verbose_name="Записей за неделю",
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = "Статистика группы"
+        verbose_name_plural = "Статистика групп"
+
+
+class GroupActivity(models.Model):
+    """Число записей группы за день; старше окна активности удаляется."""
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        verbose_name="Группа",
+        related_name="activity",
+    )
+    day = models.DateField(
+        verbose_name="День",
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name="Записей",
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = "Активность группы"
+        verbose_name_plural = "Активность групп"
+        constraints = [
+            models.UniqueConstraint(fields=["group", "day"],
+                                    name="unique_group_day"),
+        ]
+
+
+class PostTerm(models.Model):
+    """
+    Запись обратного индекса поиска: основа слова и пост, где она
+    встречается. Используется, когда база не поддерживает FTS5.
+    """
+    term = models.CharField(
+        verbose_name="Основа слова",
+        max_length=64,
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name="Пост",
+        related_name="terms",
+    )
+    weight = models.PositiveIntegerField(
+        verbose_name="Число вхождений",
+        default=1,
+    )
+
+    class Meta:
+        verbose_name = "Запись поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+        constraints = [
+            models.UniqueConstraint(fields=["term", "post"],
+                                    name="unique_post_term"),
+        ]
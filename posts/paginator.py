@@ -0,0 +1,181 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPaginator:
+    """
+    Постраничная навигация по ключу (keyset) вместо LIMIT/OFFSET.
+
+    Страница выбирается условием на значения полей ordering последней
+    (или первой) записи предыдущей страницы, поэтому глубина
+    пролистывания не влияет на стоимость запроса, а COUNT(*) не нужен.
+    Все поля ordering должны сортироваться в одном направлении, а их
+    набор - однозначно задавать порядок (последним полем идёт pk).
+    """
+
+    def __init__(self, object_list, per_page, ordering=("-pub_date", "-id")):
+        directions = {field.startswith("-") for field in ordering}
+        if len(directions) != 1:
+            raise ValueError("Поля ordering должны иметь одно направление.")
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.descending = directions.pop()
+        self.fields = tuple(field.lstrip("-") for field in self.ordering)
+
+    def encode_cursor(self, obj, reverse=False):
+        values = [getattr(obj, field) for field in self.fields]
+        payload = json.dumps(
+            [int(reverse)] + [str(value) for value in values]
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        model = self.object_list.model
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            reverse, *values = json.loads(base64.urlsafe_b64decode(padded))
+            if len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, UnicodeDecodeError,
+                ValidationError) as error:
+            raise InvalidCursor(cursor) from error
+        return bool(reverse), values
+
+    def _after(self, values, descending, inclusive=False, fields=None):
+        """
+        Условие "строго после values" для выбранного направления,
+        с inclusive - "начиная с values". fields - поля, с которыми
+        сравниваются values, по умолчанию поля ordering.
+        """
+        fields = fields or self.fields
+        lookup = "lt" if descending else "gt"
+        condition = Q()
+        for position, field in enumerate(fields):
+            last = position == len(fields) - 1
+            step = Q(**{
+                f"{field}__{lookup}{'e' if inclusive and last else ''}":
+                    values[position]
+            })
+            for prev_field, prev_value in zip(
+                    fields[:position], values[:position]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _slice(self, queryset, values, descending, inclusive, fields=None):
+        """queryset после values, упорядоченный в направлении descending."""
+        fields = fields or self.fields
+        if values is not None:
+            queryset = queryset.filter(
+                self._after(values, descending, inclusive, fields))
+        return queryset.order_by(*(
+            ("-" if descending else "") + field for field in fields
+        ))
+
+    def fetch(self, values, descending, inclusive, limit):
+        """Первые limit записей после values в направлении descending."""
+        return list(self._slice(
+            self.object_list, values, descending, inclusive)[:limit])
+
+    def page(self, cursor=None):
+        reverse, values = (False, None)
+        if cursor:
+            reverse, values = self.decode_cursor(cursor)
+        return CursorPage(self, values, reverse)
+
+    def page_from(self, *values):
+        """
+        Страница, которая начинается с записи со значениями values
+        полей ordering или с первой после них: переход по алфавиту.
+        """
+        return CursorPage(self, list(values), False, inclusive=True)
+
+    def get_page(self, cursor=None):
+        """Как Paginator.get_page: битый курсор открывает первую страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+class CursorPage:
+    """
+    Страница CursorPaginator. Запрос выполняется лениво, при первом
+    обращении к записям, поэтому страница, отрисованная из кэша
+    шаблона, не трогает базу. Готовые rows можно подставить из кэша.
+    """
+
+    def __init__(self, paginator, values, reverse, inclusive=False):
+        self.paginator = paginator
+        self.values = values
+        self.reverse = reverse
+        self.inclusive = inclusive
+
+    @cached_property
+    def rows(self):
+        paginator = self.paginator
+        rows = paginator.fetch(
+            self.values,
+            paginator.descending != self.reverse,
+            self.inclusive,
+            paginator.per_page + 1,
+        )
+        has_more = len(rows) > paginator.per_page
+        rows = rows[:paginator.per_page]
+        if self.reverse:
+            rows.reverse()
+        return rows, has_more
+
+    @property
+    def object_list(self):
+        return self.rows[0]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return "<Cursor page of %s>" % len(self)
+
+    def has_next(self):
+        if self.reverse:
+            return self.values is not None
+        return self.rows[1]
+
+    def has_previous(self):
+        if self.reverse:
+            return self.rows[1]
+        return self.values is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
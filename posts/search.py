@@ -0,0 +1,200 @@
+"""
+Полнотекстовый поиск по постам.
+
+Текст поста разбивается на слова, стоп-слова отбрасываются, русские
+слова приводятся к основе стеммером Snowball. Основы хранятся в
+обратном индексе, который сигналы Post обновляют при сохранении и
+удалении поста:
+
+* на SQLite - виртуальная таблица FTS5 posts_post_fts, где rowid равен
+  id поста, а ранжирование выполняет bm25;
+* на остальных базах - таблица PostTerm, результаты ранжируются по
+  TF-IDF в Python.
+
+Запрос находит посты, где встречаются все его основы. Миграция
+создаёт пустой индекс: посты, написанные до неё, индексирует команда
+rebuild_search_index.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Post, PostTerm
+from .stemmer import stem
+
+FTS_TABLE = "posts_post_fts"
+
+WORD_RE = re.compile(r"\w+")
+CYRILLIC_RE = re.compile(r"[а-яё]")
+
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все
+    всего всех вы где да даже для до его ее если есть еще же за здесь
+    и из или им их к как ко когда кто ли либо мне может мы на над надо
+    наш не него нее нет ни них но ну о об однако он она они оно от
+    очень по под при с со так также такой там те тем то того тоже той
+    только том ты у уже хотя чего чей чем что чтобы чье чья эта эти
+    это этот я
+""".split())
+
+
+def tokens(text):
+    """Основы слов текста в порядке появления."""
+    result = []
+    for word in WORD_RE.findall(text.lower().replace("ё", "е")):
+        if word in STOP_WORDS:
+            continue
+        if CYRILLIC_RE.search(word):
+            word = stem(word)
+        result.append(word[:PostTerm._meta.get_field("term").max_length])
+    return result
+
+
+class FTS5Index:
+    """Индекс в виртуальной таблице SQLite FTS5."""
+    name = "fts5"
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)",
+                [post.pk, " ".join(tokens(post.text))],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+    def search(self, terms, limit):
+        # Основы состоят только из букв и цифр, поэтому кавычки
+        # делают из каждой фразу и не дают сломать синтаксис MATCH.
+        match = " ".join(f'"{term}"' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY rank, rowid DESC LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+
+class TermIndex:
+    """Индекс в таблице PostTerm с ранжированием по TF-IDF."""
+    name = "terms"
+
+    def index(self, post):
+        self.remove(post.pk)
+        PostTerm.objects.bulk_create(
+            PostTerm(term=term, post_id=post.pk, weight=weight)
+            for term, weight in Counter(tokens(post.text)).items()
+        )
+
+    def remove(self, post_id):
+        PostTerm.objects.filter(post=post_id).delete()
+
+    def search(self, terms, limit):
+        frequency = dict(
+            PostTerm.objects.filter(term__in=terms).values_list(
+                "term",
+            ).annotate(Count("pk")).order_by()
+        )
+        if len(frequency) < len(terms):
+            return []
+        total = Post.objects.count()
+        scores = None
+        # Начинаем с самой редкой основы: её список постов короче
+        # всех, а следующие основы проверяются только среди него.
+        for term in sorted(terms, key=frequency.get):
+            postings = PostTerm.objects.filter(term=term)
+            if scores is None:
+                postings = postings.order_by("-post_id")[
+                    :settings.SEARCH_MAX_CANDIDATES]
+            else:
+                postings = postings.filter(post_id__in=list(scores))
+            weights = dict(postings.values_list("post_id", "weight"))
+            if scores is None:
+                scores = dict.fromkeys(weights, 0.0)
+            idf = math.log(1 + total / frequency[term])
+            scores = {
+                post_id: scores[post_id] + (1 + math.log(weight)) * idf
+                for post_id, weight in weights.items()
+                if post_id in scores
+            }
+            if not scores:
+                return []
+        ranked = sorted(scores, key=lambda post_id: (-scores[post_id],
+                                                     -post_id))
+        return ranked[:limit]
+
+    def clear(self):
+        PostTerm.objects.all().delete()
+
+
+_backends = {}
+
+
+def fts5_available():
+    """Есть ли в текущей базе таблица FTS5 (её создаёт миграция)."""
+    if connection.vendor != "sqlite":
+        return False
+    name = connection.settings_dict["NAME"]
+    if name not in _backends:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+            _backends[name] = cursor.fetchone() is not None
+    return _backends[name]
+
+
+def get_index():
+    backend = settings.SEARCH_BACKEND
+    if backend == "fts5" or (backend == "auto" and fts5_available()):
+        return FTS5Index()
+    return TermIndex()
+
+
+def search(query, limit=None):
+    """Id постов, подходящих под запрос, от самых релевантных."""
+    terms = list(dict.fromkeys(tokens(query)))
+    if not terms:
+        return []
+    return get_index().search(terms, limit or settings.SEARCH_MAX_RESULTS)
+
+
+def index_post(post):
+    get_index().index(post)
+
+
+def remove_post(post_id):
+    get_index().remove(post_id)
+
+
+def rebuild(batch_size=1000):
+    """Переиндексирует все посты; возвращает их число."""
+    index = get_index()
+    with transaction.atomic():
+        index.clear()
+    count = last_pk = 0
+    while True:
+        batch = list(Post.objects.only("text").filter(
+            pk__gt=last_pk,
+        ).order_by("pk")[:batch_size])
+        if not batch:
+            return count
+        # Каждая пачка пишется в своей транзакции, а не построчно.
+        with transaction.atomic():
+            for post in batch:
+                index.index(post)
+        count += len(batch)
+        last_pk = batch[-1].pk
@@ -0,0 +1,237 @@
+import threading
+
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from . import feed, groups, search
+from .cache import bump
+from .models import (
+    AuthorStats, Comment, Follow, Group, GroupStats, Post, User,
+)
+
+
+# Посты, которые сейчас удаляются в этом потоке. Их комментарии уходят
+# по CASCADE, и сбрасывать страницы поста за каждый из них незачем:
+# это сделает сигнал самого поста.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if not hasattr(_deleting, "posts"):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+def _count(user_id, delta, *fields):
+    AuthorStats.objects.filter(user=user_id).update(**{
+        field: F(field) + delta for field in fields
+    })
+
+
+def _usernames(*user_ids):
+    return User.objects.filter(pk__in=user_ids).values_list(
+        "username", flat=True,
+    )
+
+
+def post_scopes(post):
+    """Поколения страниц, на которых виден пост."""
+    group_ids = {post.group_id, getattr(post, "_old_group_id", None)}
+    scopes = ["posts", f"post:{post.pk}"]
+    scopes += [
+        f"group:{slug}" for slug in Group.objects.filter(
+            pk__in=group_ids - {None},
+        ).values_list("slug", flat=True)
+    ]
+    scopes += [f"profile:{name}" for name in _usernames(post.author_id)]
+    if feed.is_celebrity(post.author_id):
+        scopes.append(f"celebrity:{post.author_id}")
+    else:
+        scopes += [
+            f"follow:{user_id}" for user_id in Follow.objects.filter(
+                author=post.author_id,
+            ).values_list("user_id", flat=True)
+        ]
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_group_id = Post.objects.filter(
+            pk=instance.pk,
+        ).values_list("group_id", flat=True).first()
+
+
+def _bump_card_versions(posts):
+    posts.update(version=F("version") + 1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        _count(instance.author_id, 1, "posts_count")
+        feed.fan_out(instance)
+    bump(*post_scopes(instance))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_deleted_post(sender, instance, **kwargs):
+    _deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    _deleting_posts().discard(instance.pk)
+    _count(instance.author_id, -1, "posts_count")
+    bump(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Post)
+def count_group_post(sender, instance, created, **kwargs):
+    old_group_id = None if created else getattr(
+        instance, "_old_group_id", instance.group_id)
+    if old_group_id == instance.group_id:
+        return
+    if old_group_id:
+        groups.record_post(old_group_id, instance.pub_date, -1)
+    if instance.group_id:
+        groups.record_post(instance.group_id, instance.pub_date, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_group_post(sender, instance, **kwargs):
+    if instance.group_id:
+        groups.record_post(instance.group_id, instance.pub_date, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "text" in update_fields:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts():
+        return
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        bump(*post_scopes(post))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_slug, instance._old_title = Group.objects.filter(
+            pk=instance.pk,
+        ).values_list("slug", "title").first() or (None, None)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(pre_delete, sender=Group)
+def bump_group_cards(sender, instance, **kwargs):
+    # SET_NULL снимет группу с постов запросом UPDATE, без сигналов.
+    _bump_card_versions(Post.objects.filter(group=instance))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    # Название группы выводится в карточке каждого её поста.
+    if (getattr(instance, "_old_slug", instance.slug),
+            getattr(instance, "_old_title", instance.title)) != (
+            instance.slug, instance.title):
+        _bump_card_versions(Post.objects.filter(group=instance))
+    bump(
+        "groups",
+        "group_slugs",
+        "posts",
+        f"group:{instance.slug}",
+        f"group:{getattr(instance, '_old_slug', None) or instance.slug}",
+    )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        _count(instance.author_id, 1, "followers_count")
+        _count(instance.user_id, 1, "following_count")
+        if feed.followers_changed(instance.author_id, 1):
+            invalidate_followers(instance.author_id)
+        feed.backfill(instance.user_id, instance.author_id)
+    invalidate_follow(sender, instance)
+
+
+@receiver(post_delete, sender=Follow)
+def purge_feed(sender, instance, **kwargs):
+    _count(instance.author_id, -1, "followers_count")
+    _count(instance.user_id, -1, "following_count")
+    feed.purge(instance.user_id, instance.author_id)
+    if feed.followers_changed(instance.author_id, -1):
+        invalidate_followers(instance.author_id)
+    invalidate_follow(sender, instance)
+
+
+def invalidate_followers(author_id):
+    # Автор перешёл FEED_FANOUT_LIMIT: его посты в лентах всех
+    # подписчиков теперь читаются по-другому.
+    bump(
+        f"celebrity:{author_id}",
+        *(f"follow:{user_id}" for user_id in Follow.objects.filter(
+            author=author_id,
+        ).values_list("user_id", flat=True)),
+    )
+
+
+def invalidate_follow(sender, instance, **kwargs):
+    bump(
+        f"follow:{instance.user_id}",
+        *(f"profile:{name}" for name in _usernames(
+            instance.user_id, instance.author_id,
+        )),
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_username = _usernames(instance.pk).first()
+
+
+@receiver(post_save, sender=User)
+def bump_author_cards(sender, instance, created, **kwargs):
+    # Имя автора выводится в карточке каждого его поста.
+    old_username = getattr(instance, "_old_username", None)
+    if not created and old_username not in (None, instance.username):
+        _bump_card_versions(Post.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_users(sender, instance, update_fields=None, **kwargs):
+    # Вход на сайт сохраняет только last_login, которого нет ни в
+    # каталоге, ни в профиле: страницы не сбрасываются на каждый вход.
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    bump("users", f"profile:{instance.username}")
@@ -0,0 +1,29 @@
+// Подгрузка комментариев: кнопка "Показать ещё" заменяется следующей
+// страницей, которую отдаёт фрагмент post_comments. Без JavaScript
+// кнопка остаётся обычной ссылкой на страницу поста с курсором.
+document.addEventListener("click", function (event) {
+    var button = event.target.closest(".load-comments");
+    if (!button) {
+        return;
+    }
+    event.preventDefault();
+    if (button.classList.contains("disabled")) {
+        return;
+    }
+    button.classList.add("disabled");
+    fetch(button.dataset.url, {credentials: "same-origin"})
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        })
+        .then(function (html) {
+            button.insertAdjacentHTML("beforebegin", html);
+            button.remove();
+        })
+        .catch(function () {
+            // Не получилось - переходим по ссылке как без JavaScript.
+            window.location = button.href;
+        });
+});
@@ -0,0 +1,111 @@
+"""
+Стеммер русского языка по алгоритму Snowball (Портера).
+
+Окончания отрезаются только в области RV (после первой гласной),
+словообразовательные суффиксы - в области R2. Среди подходящих
+окончаний группы всегда выбирается самое длинное.
+"""
+import functools
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND = (
+    ("в", "вши", "вшись"),
+    ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"),
+)
+REFLEXIVE = ((), ("ся", "сь"))
+ADJECTIVE = ((), (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем",
+    "им", "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю",
+    "ая", "яя", "ою", "ею",
+))
+PARTICIPLE = (
+    ("ем", "нн", "вш", "ющ", "щ"),
+    ("ивш", "ывш", "ующ"),
+)
+VERB = (
+    ("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но",
+     "ет", "ют", "ны", "ть", "ешь", "нно"),
+    ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей",
+     "уй", "ил", "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует",
+     "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"),
+)
+NOUN = ((), (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии",
+    "и", "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам",
+    "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия",
+    "ья", "я",
+))
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+
+def _region(word, start):
+    """Начало области после первой согласной, идущей за гласной."""
+    for i in range(start + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word, start, groups):
+    """
+    Отрезает самое длинное окончание из groups, целиком лежащее
+    после start. Окончания первой группы должны идти после "а" или "я".
+    Возвращает None, если отрезать нечего.
+    """
+    conditional, plain = groups
+    best = None
+    for needs_a, endings in ((True, conditional), (False, plain)):
+        for ending in endings:
+            if (word.endswith(ending)
+                    and len(word) - len(ending) >= start
+                    and (best is None or len(ending) > len(best[0]))):
+                best = (ending, needs_a)
+    if best is None:
+        return None
+    ending, needs_a = best
+    cut = len(word) - len(ending)
+    if needs_a and (cut - 1 < start or word[cut - 1] not in "ая"):
+        return None
+    return word[:cut]
+
+
+@functools.lru_cache(maxsize=100000)
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    rv = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+
+    result = _strip(word, rv, PERFECTIVE_GERUND)
+    if result is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        result = _strip(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _strip(result, rv, PARTICIPLE) or result
+        else:
+            result = (_strip(word, rv, VERB)
+                      or _strip(word, rv, NOUN))
+    if result is not None:
+        word = result
+
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    for ending in DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+            break
+
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    for ending in SUPERLATIVE:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            word = word[:-len(ending)]
+            if word.endswith("нн") and len(word) - 2 >= rv:
+                word = word[:-1]
+            return word
+    if word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
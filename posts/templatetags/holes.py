@@ -0,0 +1,52 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import holes
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, kind, arg, nodelist):
+        self.kind = kind
+        self.arg = arg
+        self.nodelist = nodelist
+
+    def render(self, context):
+        kind = self.kind.resolve(context)
+        arg = self.arg.resolve(context) if self.arg else None
+        if holes.is_punching():
+            return holes.hole(kind, arg, self.nodelist.render(context))
+        request = context.request
+        following = {arg} if (kind in holes.FOLLOW_KINDS
+                              and holes.follows(request, arg)) else set()
+        if holes.visible(kind, arg, request.user, following):
+            return self.nodelist.render(context)
+        return ""
+
+
+@register.tag
+def hole(parser, token):
+    """
+    {% hole "вид" [id] %}...{% endhole %} - часть страницы, которая
+    видна не всем пользователям (см. posts.holes).
+    """
+    bits = token.split_contents()
+    if len(bits) not in (2, 3):
+        raise template.TemplateSyntaxError(
+            f"{bits[0]} принимает вид блока и, возможно, id")
+    nodelist = parser.parse(("endhole",))
+    parser.delete_first_token()
+    return HoleNode(
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]) if len(bits) == 3 else None,
+        nodelist,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def viewer(context, name):
+    """{% viewer "username" %} - значение текущего пользователя."""
+    if holes.is_punching():
+        return mark_safe(f"<!--viewer:{name}-->")
+    return mark_safe(holes.viewer(name, context.request.user))
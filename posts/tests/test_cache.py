@@ -0,0 +1,76 @@
+import time
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from posts.cache import bump, generations, get_or_compute
+
+
+@override_settings(CACHE_EARLY_REFRESH_BETA=0, CACHE_LOCK_WAIT=0.1)
+class StampedeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.compute = Mock(return_value='свежее')
+
+    def test_fresh_entry(self):
+        """Свежая запись отдаётся без пересчёта."""
+        get_or_compute('key', (1,), self.compute, 60)
+        value, hit = get_or_compute('key', (1,), self.compute, 60)
+        self.assertEqual((value, hit), ('свежее', True))
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_stale_while_revalidate(self):
+        """Пока другой запрос пересчитывает, отдаётся устаревшая копия."""
+        get_or_compute('key', (1,), lambda: 'старое', 60)
+        cache.add('key:lock', 1)
+        value, hit = get_or_compute('key', (2,), self.compute, 60)
+        self.assertEqual((value, hit), ('старое', True))
+        self.compute.assert_not_called()
+
+    def test_single_flight_release(self):
+        """Пересчитавший запрос снимает блокировку и сохраняет версию."""
+        get_or_compute('key', (1,), lambda: 'старое', 60)
+        value, hit = get_or_compute('key', (2,), self.compute, 60)
+        self.assertEqual((value, hit), ('свежее', False))
+        self.assertIsNone(cache.get('key:lock'))
+        self.assertEqual(cache.get('key')['version'], (2,))
+
+    def test_missing_entry_waits_then_computes(self):
+        """Без копии запрос ждёт блокировку и считает сам по таймауту."""
+        cache.add('key:lock', 1)
+        value, hit = get_or_compute('key', (1,), self.compute, 60)
+        self.assertEqual((value, hit), ('свежее', False))
+        self.assertEqual(cache.get('key:lock'), 1)
+
+    @override_settings(CACHE_EARLY_REFRESH_BETA=10 ** 9)
+    def test_early_refresh(self):
+        """Долгий пересчёт с большим beta обновляется до истечения срока."""
+        get_or_compute('key', (1,), lambda: 'старое', 60)
+        entry = cache.get('key')
+        entry['delta'] = 1.0
+        cache.set('key', entry)
+        value, _ = get_or_compute('key', (1,), self.compute, 60)
+        self.assertEqual(value, 'свежее')
+
+
+class GenerationTest(TestCase):
+    def test_bump(self):
+        """bump меняет только указанные поколения."""
+        cache.clear()
+        before = generations('posts', 'group:test')
+        bump('group:test')
+        after = generations('posts', 'group:test')
+        self.assertEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+
+    @override_settings(GENERATION_TIMEOUT=20)
+    def test_local_generations_expire(self):
+        """Поколения в кэше процесса истекают, и страницы обновляются."""
+        cache.clear()
+        before = generations('posts')
+        bump('posts')
+        after = generations('posts')
+        with patch('time.time', return_value=time.time() + 21):
+            self.assertGreater(generations('posts')[0], after[0])
+        self.assertGreater(after[0], before[0])
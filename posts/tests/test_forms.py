@@ -0,0 +1,87 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.models import Post
+
+
+class ImageIngestTest(TestCase):
+    @staticmethod
+    def get_image(size, ext='jpeg', exif=None):
+        file_obj = BytesIO()
+        image = Image.new('RGB', size=size, color=(200, 0, 0))
+        if exif is not None:
+            image.save(file_obj, ext, exif=exif)
+        else:
+            image.save(file_obj, ext)
+        return SimpleUploadedFile(
+            'photo.' + ext, file_obj.getvalue(), content_type='image/jpeg')
+
+    def make_form(self, upload):
+        return PostForm({'text': 'Пост с картинкой'}, {'image': upload})
+
+    @override_settings(POST_IMAGE_MAX_SIZE=(100, 100),
+                       POST_IMAGE_FORMATS=('WEBP', 'JPEG'))
+    def test_downscale_and_reencode(self):
+        """Картинка уменьшается, перекодируется и теряет метаданные."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Телефон'
+        form = self.make_form(self.get_image((400, 200), exif=exif))
+        self.assertTrue(form.is_valid(), form.errors)
+        stored = form.cleaned_data['image']
+        self.assertTrue(stored.name.endswith('.webp'))
+        with Image.open(BytesIO(stored.read())) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (100, 50))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_decompression_bomb(self):
+        """Картинки с огромным числом пикселей отклоняются."""
+        form = self.make_form(self.get_image((20, 20)))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'][0].split(':')[0],
+                         'Слишком большое изображение')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_upload_too_large(self):
+        """Слишком тяжёлый файл отклоняется до открытия картинки."""
+        form = self.make_form(self.get_image((50, 50)))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'], ['Файл больше 100\xa0байт.'])
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_upload_handler_stops_writing(self):
+        """Обработчик загрузки не пишет на диск больше предела."""
+        client = Client()
+        client.force_login(User.objects.create_user(username='Witcher'))
+        response = client.post(reverse('new_post'), {
+            'text': 'Тяжёлая картинка',
+            'image': self.get_image((50, 50)),
+        })
+        self.assertFormError(response, 'form', 'image',
+                             'Файл больше 100\xa0байт.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_upload_views_keep_csrf(self):
+        """Страницы с ограниченной загрузкой по-прежнему проверяют CSRF."""
+        user = User.objects.create_user(username='Witcher')
+        post = Post.objects.create(author=user, text='Пост')
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(user)
+        for url in (reverse('new_post'),
+                    reverse('post_edit', args=[user.username, post.pk])):
+            with self.subTest(url=url):
+                response = client.post(url, {'text': 'Без токена'})
+                self.assertEqual(response.status_code, 403)
+                client.get(url)
+                response = client.post(url, {
+                    'text': 'С токеном',
+                    'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+                })
+                self.assertEqual(response.status_code, 302)
@@ -50,3 +50,13 @@ class StaticURLTests(TestCase):
         """Проверяем работу метода str у модели Group."""
         group_name = self.group.title
         self.assertEquals(group_name, str(self.group))
+
+    def test_version_bump_is_atomic(self):
+        """Сохранение поста не теряет параллельный сдвиг версии."""
+        version = self.post_user.version
+        Post.objects.filter(pk=self.post_user.pk).update(version=version + 1)
+        self.post_user.text = 'Исправленный текст'
+        self.post_user.save()
+        self.assertEqual(self.post_user.version, version + 2)
+        self.post_user.save(update_fields=['text'])
+        self.assertEqual(self.post_user.version, version + 3)
@@ -0,0 +1,229 @@
+"""
+Бюджеты SQL-запросов и времени ответа для каждой страницы posts.urls.
+
+База заполняется данными заметного объёма: авторы с разной
+популярностью, сотни постов, комментарии и подписки. Тест падает,
+если страница делает больше запросов или отвечает дольше бюджета.
+Время ответа зависит от машины, поэтому его бюджет проверяется
+только с PERF_TIME_BUDGETS=1 и умножается на PERF_TIME_SCALE (для
+медленных машин CI); бюджеты запросов проверяются всегда.
+PERF_REPORT=1 печатает замеры.
+"""
+import os
+import sys
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import search, urls
+from posts.groups import roll_daily
+from posts.models import (
+    AuthorStats, Comment, FeedEntry, Follow, Group, Post,
+)
+
+USERS = 40
+GROUPS = 5
+POSTS = 400
+
+TIME_BUDGETS = os.getenv("PERF_TIME_BUDGETS") == "1"
+TIME_SCALE = float(os.getenv("PERF_TIME_SCALE", 1))
+
+# Имя url: (запросов без кэша, запросов из кэша, миллисекунд).
+# Две неизбежные выборки - сессия и пользователь. Страница из кэша
+# общая для всех, и профиль ещё проверяет подписку для кнопки. Лента
+# подписок берёт ключи из FeedEntry и постов знаменитостей, а потом
+# посты страницы по pk.
+READ_BUDGETS = {
+    "index": (3, 2, 150),
+    "follow_index": (5, 2, 150),
+    "users": (5, 2, 150),
+    "groups": (4, 2, 100),
+    "new_post": (3, 3, 100),
+    "search": (4, 2, 150),
+    "group": (4, 2, 150),
+    "profile": (5, 3, 150),
+    "post": (5, 5, 150),
+    "post_edit": (4, 4, 100),
+    "post_comments": (4, 4, 100),
+}
+# Имя url: (запросов, миллисекунд). Запись включает сигналы: счётчики,
+# ленты подписчиков, поисковый индекс и поколения кэша.
+WRITE_BUDGETS = {
+    "new_post": (12, 150),
+    "post_edit": (10, 150),
+    "add_comment": (11, 100),
+    "delete_comment": (12, 100),
+    "profile_follow": (12, 150),
+    "profile_unfollow": (10, 150),
+    "post_delete": (13, 150),
+}
+
+
+def seed():
+    """Заполняет базу: популярность авторов убывает по закону Ципфа."""
+    User.objects.bulk_create(
+        User(username=f"user{number}") for number in range(USERS))
+    users = list(User.objects.order_by("pk"))
+    Group.objects.bulk_create(
+        Group(title=f"Группа {number}", slug=f"group{number}",
+              description="Описание")
+        for number in range(GROUPS))
+    groups = list(Group.objects.all())
+    Post.objects.bulk_create(
+        Post(author=users[number % (number % USERS + 1)],
+             group=groups[number % GROUPS] if number % 3 else None,
+             text=f"Запись номер {number} про котов и книги")
+        for number in range(POSTS))
+    Comment.objects.bulk_create(
+        Comment(post=post, author=users[number % USERS],
+                text="Комментарий")
+        for post in Post.objects.order_by("-pk")[:50]
+        for number in range(5))
+    Follow.objects.bulk_create(
+        Follow(user=user, author=author)
+        for user in users for author in users[:8] if user != author)
+    for command in ("rebuild_author_stats", "recount_comments",
+                    "rebuild_feeds", "rebuild_search_index",
+                    "rebuild_group_stats"):
+        call_command(command, stdout=StringIO())
+
+
+class PerformanceTest(TestCase):
+    report = []
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.author = User.objects.get(username="user0")
+        cls.reader = User.objects.get(username="user1")
+        cls.post = cls.author.posts.first()
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.getenv("PERF_REPORT"):
+            for line in cls.report:
+                print(line, file=sys.stderr)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def measure(self, name, client, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data or {})
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, name)
+        self.report.append(
+            f"{name:<18}{method:<6}{len(queries):>4} запросов "
+            f"{elapsed:>8.1f} мс")
+        return len(queries), elapsed
+
+    def check(self, name, measured, queries, milliseconds):
+        count, elapsed = measured
+        self.assertLessEqual(
+            count, queries, f"{name}: {count} запросов из {queries}")
+        if not TIME_BUDGETS:
+            return
+        self.assertLessEqual(
+            elapsed, milliseconds * TIME_SCALE,
+            f"{name}: {elapsed:.0f} мс из {milliseconds * TIME_SCALE:.0f}")
+
+    def read_requests(self):
+        post_args = [self.author.username, self.post.pk]
+        return {
+            "index": (self.reader_client, reverse("index"), {}),
+            "follow_index": (self.reader_client, reverse("follow_index"), {}),
+            "users": (self.reader_client, reverse("users"), {}),
+            "groups": (self.reader_client, reverse("groups"), {}),
+            "new_post": (self.author_client, reverse("new_post"), {}),
+            "search": (self.reader_client, reverse("search"), {"q": "коты"}),
+            "group": (self.reader_client,
+                      reverse("group", args=["group1"]), {}),
+            "profile": (self.reader_client,
+                        reverse("profile", args=[self.author.username]), {}),
+            "post": (self.reader_client, reverse("post", args=post_args), {}),
+            "post_edit": (self.author_client,
+                          reverse("post_edit", args=post_args), {}),
+            "post_comments": (self.reader_client,
+                              reverse("post_comments", args=post_args), {}),
+        }
+
+    def test_budgets_cover_all_urls(self):
+        """Бюджет задан для каждой страницы posts.urls."""
+        self.assertEqual(
+            {pattern.name for pattern in urls.urlpatterns},
+            set(READ_BUDGETS) | set(WRITE_BUDGETS))
+
+    def test_read_budgets(self):
+        """Страницы укладываются в бюджет без кэша и из кэша."""
+        for name, (client, url, data) in self.read_requests().items():
+            cold_queries, warm_queries, milliseconds = READ_BUDGETS[name]
+            with self.subTest(view=name):
+                cache.clear()
+                # Окно активности групп сдвигается раз в день, а не
+                # на каждый запрос без кэша.
+                roll_daily()
+                self.check(name, self.measure(name, client, "get", url, data),
+                           cold_queries, milliseconds)
+                self.check(name, self.measure(name, client, "get", url, data),
+                           warm_queries, milliseconds)
+
+    def test_write_budgets(self):
+        """Запись укладывается в бюджет вместе с работой сигналов."""
+        post_args = [self.author.username, self.post.pk]
+        comment = self.post.comments.create(author=self.reader, text="Ок")
+        requests = [
+            ("new_post", self.author_client, reverse("new_post"),
+             {"text": "Новая запись", "group": ""}),
+            ("post_edit", self.author_client,
+             reverse("post_edit", args=post_args),
+             {"text": "Исправленная запись"}),
+            ("add_comment", self.reader_client,
+             reverse("add_comment", args=post_args), {"text": "Ещё"}),
+            ("delete_comment", self.reader_client,
+             reverse("delete_comment", args=post_args + [comment.pk]), {}),
+            ("profile_unfollow", self.reader_client,
+             reverse("profile_unfollow", args=[self.author.username]), {}),
+            ("profile_follow", self.reader_client,
+             reverse("profile_follow", args=[self.author.username]), {}),
+            ("post_delete", self.author_client,
+             reverse("post_delete", args=post_args), {}),
+        ]
+        for name, client, url, data in requests:
+            method = "post" if data else "get"
+            with self.subTest(view=name):
+                self.check(name, self.measure(name, client, method, url, data),
+                           *WRITE_BUDGETS[name])
+
+
+class SeedCommandTest(TestCase):
+    def test_seed(self):
+        """seed_yatube заполняет базу и пересчитывает производные данные."""
+        call_command("seed_yatube", users=30, groups=3, posts=300,
+                     comments=200, follows=5, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 200)
+        posts = sorted(AuthorStats.objects.values_list(
+            "posts_count", flat=True), reverse=True)
+        self.assertEqual(sum(posts), 300)
+        # Популярность авторов неравномерна.
+        self.assertGreater(posts[0], 300 / 30 * 3)
+        dates = list(Post.objects.order_by("pk").values_list(
+            "pub_date", flat=True))
+        self.assertEqual(dates, sorted(set(dates)))
+        follow = Follow.objects.first()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=follow.user, post__author=follow.author).exists())
+        self.assertTrue(search.search("кот"))
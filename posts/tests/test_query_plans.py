@@ -0,0 +1,150 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import urls
+from posts.models import Comment, Follow, Group, Post
+
+# Полный просмотр таблицы. Проход по индексу допустим только для
+# запроса первой страницы без фильтра: он останавливается на LIMIT.
+SCAN_RE = re.compile(
+    r"^SCAN (?!.*VIRTUAL TABLE)(\S+)(?P<index> USING .*INDEX)?")
+# Группы - маленький справочник: каталог и выпадающий список в форме
+# поста читают его полностью, а запись поста раз в день сдвигает окно
+# активности всех групп.
+SMALL_TABLES = ("posts_group", "posts_groupstats", "posts_groupactivity")
+
+
+class QueryPlanTest(TestCase):
+    """EXPLAIN для каждого запроса каждой страницы posts.urls."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Witcher')
+        self.reader = User.objects.create_user(username='Geralt')
+        self.group = Group.objects.create(
+            title='Ведьмаки', slug='witchers', description='Школа волка')
+        self.posts = [
+            Post.objects.create(author=self.author, group=self.group,
+                                text=f'Запись про котов номер {number}')
+            for number in range(15)
+        ]
+        self.post = self.posts[-1]
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def requests(self):
+        """(имя url, клиент, метод, адрес, данные) для каждой страницы."""
+        post_args = [self.author.username, self.post.pk]
+        author, reader = self.author_client, self.reader_client
+        return [
+            ('index', reader, 'get', reverse('index'), {}),
+            ('follow_index', reader, 'get', reverse('follow_index'), {}),
+            ('users', reader, 'get', reverse('users'), {}),
+            ('users', reader, 'get', reverse('users'), {'from': 'H'}),
+            ('groups', reader, 'get', reverse('groups'), {}),
+            ('new_post', author, 'get', reverse('new_post'), {}),
+            ('search', reader, 'get', reverse('search'), {'q': 'коты'}),
+            ('group', reader, 'get', reverse('group', args=['witchers']), {}),
+            ('profile', reader, 'get',
+             reverse('profile', args=[self.author.username]), {}),
+            ('post', reader, 'get', reverse('post', args=post_args), {}),
+            ('post_edit', author, 'get',
+             reverse('post_edit', args=post_args), {}),
+            ('post_comments', reader, 'get',
+             reverse('post_comments', args=post_args), {}),
+            ('add_comment', reader, 'post',
+             reverse('add_comment', args=post_args), {'text': 'Ещё'}),
+            ('delete_comment', author, 'get',
+             reverse('delete_comment', args=post_args + [self.comment.pk]),
+             {}),
+            ('profile_unfollow', reader, 'get',
+             reverse('profile_unfollow', args=[self.author.username]), {}),
+            ('profile_follow', reader, 'get',
+             reverse('profile_follow', args=[self.author.username]), {}),
+            ('post_delete', author, 'get',
+             reverse('post_delete', args=post_args), {}),
+        ]
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, sql):
+        if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+            return []
+        scans = []
+        for line in self.plan(sql):
+            match = SCAN_RE.match(line)
+            if (match and match[1] not in SMALL_TABLES
+                    and not (match['index'] and ' LIMIT ' in sql
+                             and ' WHERE ' not in sql)):
+                scans.append(line)
+        return scans
+
+    def test_no_full_scans(self):
+        """Ни один запрос страниц не читает таблицу целиком."""
+        names = {pattern.name for pattern in urls.urlpatterns}
+        visited = set()
+        for name, client, method, url, data in self.requests():
+            visited.add(name)
+            with CaptureQueriesContext(connection) as queries:
+                getattr(client, method)(url, data)
+            for query in queries.captured_queries:
+                with self.subTest(view=name, sql=query['sql']):
+                    self.assertEqual(self.full_scans(query['sql']), [])
+        self.assertEqual(visited, names)
+
+    def test_next_page(self):
+        """Следующие страницы лент и комментариев тоже идут по индексам."""
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.reader, text='Ещё')
+            for _ in range(30))
+        url = reverse('post', args=[self.author.username, self.post.pk])
+        cursor = self.reader_client.get(url).context['comments'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(
+                reverse('post_comments',
+                        args=[self.author.username, self.post.pk]),
+                {'cursor': cursor})
+        for query in queries.captured_queries:
+            with self.subTest(view='post_comments', sql=query['sql']):
+                self.assertEqual(self.full_scans(query['sql']), [])
+        for name, args in (('index', []), ('group', ['witchers']),
+                           ('profile', [self.author.username]),
+                           ('follow_index', [])):
+            url = reverse(name, args=args)
+            page = self.reader_client.get(url).context['page']
+            with CaptureQueriesContext(connection) as queries:
+                self.reader_client.get(url, {'cursor': page.next_cursor})
+            for query in queries.captured_queries:
+                with self.subTest(view=name, sql=query['sql']):
+                    self.assertEqual(self.full_scans(query['sql']), [])
+
+    def test_feed_without_sort(self):
+        """Лента подписок читается из FeedEntry по индексу, без сортировки."""
+        url = reverse('follow_index')
+        page = self.reader_client.get(url).context['page']
+        for params in ({}, {'cursor': page.next_cursor}):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.reader_client.get(url, params)
+            feed = [query['sql'] for query in queries.captured_queries
+                    if 'FROM "posts_feedentry"' in query['sql']]
+            self.assertEqual(len(feed), 1)
+            self.assertEqual(self.plan(feed[0]), [
+                'SEARCH posts_feedentry USING COVERING INDEX '
+                'feed_user_pub_date_idx (user_id=?{})'.format(
+                    ' AND pub_date<?' if params else ''),
+            ])
@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post, PostTerm
+from posts.stemmer import stem
+
+
+class StemmerTest(TestCase):
+    def test_word_forms(self):
+        """Формы одного слова приводятся к одной основе."""
+        for words, expected in (
+            (('кот', 'коты', 'котов', 'котами'), 'кот'),
+            (('книга', 'книги', 'книгой'), 'книг'),
+            (('красивая', 'красивые', 'красивого'), 'красив'),
+            (('ёжик', 'ежики'), 'ежик'),
+        ):
+            for word in words:
+                self.assertEqual(stem(word), expected, word)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Witcher')
+        self.client = Client()
+        self.cats = Post.objects.create(
+            author=self.user, text='Коты любят рыбу, а рыба любит воду')
+        self.fish = Post.objects.create(
+            author=self.user, text='Свежая рыба на рынке')
+        self.books = Post.objects.create(
+            author=self.user, text='Хорошие книги и хорошие коты')
+
+    def assertFound(self, query, posts):
+        self.assertEqual(search.search(query), [post.pk for post in posts])
+
+    def check_index(self):
+        self.assertFound('рыбой', [self.cats, self.fish])
+        self.assertFound('кот книгами', [self.books])
+        self.assertFound('собаки', [])
+        self.assertFound('и а', [])
+
+        self.fish.text = 'Свежие собаки'
+        self.fish.save()
+        self.assertFound('собака', [self.fish])
+        self.assertFound('рыба', [self.cats])
+
+        self.cats.delete()
+        self.assertFound('рыба', [])
+
+    def test_fts5_index(self):
+        """На SQLite поиск идёт по FTS5 и учитывает формы слов."""
+        self.assertIsInstance(search.get_index(), search.FTS5Index)
+        self.check_index()
+
+    @override_settings(SEARCH_BACKEND='terms')
+    def test_term_index(self):
+        """Запасной индекс в PostTerm ищет так же."""
+        search.rebuild()
+        self.assertTrue(PostTerm.objects.filter(term='рыб').exists())
+        self.check_index()
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты с разбивкой."""
+        for number in range(12):
+            Post.objects.create(author=self.user, text=f'Кот номер {number}')
+        response = self.client.get(reverse('search'), {'q': 'коты'})
+        self.assertEqual(response.context['paginator'].count, 14)
+        self.assertEqual(len(response.context['page'].object_list), 10)
+        self.assertContains(response, 'page=2')
+        response = self.client.get(
+            reverse('search'), {'q': 'коты', 'page': 2})
+        self.assertEqual(len(response.context['page'].object_list), 4)
+
+    def test_admin_search(self):
+        """Поиск в админке использует индекс."""
+        admin = User.objects.create_superuser(username='admin')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'книга'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.books])
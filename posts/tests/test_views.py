@@ -1,14 +1,29 @@
+import base64
+import json
+import re
 import shutil
 import tempfile
-from unittest.mock import MagicMock
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.core.files import File
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Post, Group, Follow
+from django.utils import timezone
+from posts.models import (
+    AuthorStats, Comment, FeedEntry, Follow, Group, GroupActivity,
+    GroupStats, Post,
+)
+from posts.groups import group_by_slug, roll_activity
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from io import BytesIO
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from posts.cache import _key, generations, stats
+from posts.thumbnails import generate
+from io import BytesIO, StringIO
 from PIL import Image
 
 
@@ -103,6 +118,20 @@ class PostTest(PreparationTests):
         urls_list.append(post_url)
         self.url_test(post, urls_list)
 
+    def test_post_edit_keeps_counters(self):
+        """Правка не затирает счётчик, изменённый после загрузки поста."""
+        loaded = Post.objects.get(pk=self.post_user2.pk)
+        Post.objects.filter(pk=loaded.pk).update(comments_count=5)
+        author_client = Client()
+        author_client.force_login(self.user2)
+        with patch('posts.views.get_object_or_404', return_value=loaded):
+            author_client.post(
+                reverse('post_edit', args=[self.user2.username, loaded.pk]),
+                {'text': 'Исправленный текст'})
+        self.post_user2.refresh_from_db()
+        self.assertEqual(self.post_user2.text, 'Исправленный текст')
+        self.assertEqual(self.post_user2.comments_count, 5)
+
     def url_test(self, post, urls_list):
         for url in urls_list:
             with self.subTest(i=url):
@@ -160,6 +189,23 @@ class FileTest(PreparationTests):
                 webpage = self.unauthorized_client.get(url)
                 self.assertContains(webpage, "<img")
 
+    def test_thumbnails_pregenerated(self):
+        """Пока миниатюры готовятся, выводится картинка, потом их адрес."""
+        self.authorized_client.post(
+            reverse('new_post'),
+            {'text': 'Картинка с миниатюрой',
+             'image': self.get_image_file('thumb.png'),
+             })
+        post = Post.objects.get(text='Картинка с миниатюрой')
+        self.assertEqual(post.thumbnails, {})
+        webpage = self.unauthorized_client.get(self.index_url)
+        self.assertContains(webpage, f'src="{post.image.url}"')
+        generate(post.id)
+        post.refresh_from_db()
+        self.assertEqual(set(post.thumbnails), set(settings.THUMBNAIL_SIZES))
+        webpage = self.unauthorized_client.get(self.index_url)
+        self.assertContains(webpage, post.thumbnails['card'])
+
     def test_not_image_add(self):
         """Проверяем защиту от другого формата."""
         response = self.authorized_client.post(
@@ -175,20 +221,33 @@ class FileTest(PreparationTests):
                              + 'поврежден или не является изображением.')
 
     def test_cash(self):
-        """Проверяем работу кэша."""
+        """Проверяем работу кэша: страница берётся из кэша до изменений."""
         text = 'Проверяем работу кэш'
+        cache.clear()
         webpage = self.unauthorized_client.get(self.index_url)
-        post = Post.objects.create(
+        self.assertIsNotNone(webpage.context)
+        webpage = self.unauthorized_client.get(self.index_url)
+        self.assertIsNone(webpage.context)
+        Post.objects.create(
             author=self.user,
             text=text,
             group=self.group
         )
         webpage = self.unauthorized_client.get(self.index_url)
-        self.assertNotIn(text, webpage.content.decode('UTF-8'))
-        cache.clear()
-        webpage = self.unauthorized_client.get(self.index_url)
         self.assertEqual(text, webpage.context['page'].object_list[0].text)
 
+    def test_cache_scopes(self):
+        """Новый пост сбрасывает только затронутые страницы."""
+        cache.clear()
+        other_profile = reverse('profile', args=[self.user2.username])
+        for url in (self.group_url, other_profile):
+            self.unauthorized_client.get(url)
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        self.assertIsNotNone(
+            self.unauthorized_client.get(self.group_url).context)
+        self.assertIsNone(
+            self.unauthorized_client.get(other_profile).context)
+
 
 class FollowTest(PreparationTests):
     def test_follow(self):
@@ -215,5 +274,660 @@ class FollowTest(PreparationTests):
         """Проверяем отсутсвие нового поста у неподписанного пользователя"""
         cache.clear()
         unfollow_url = self.authorized_client.get(self.follow_url)
-        post_unfollow = unfollow_url.context['page'].object_list.count()
+        post_unfollow = len(unfollow_url.context['page'].object_list)
         self.assertEqual(post_unfollow, 0)
+
+
+class PaginatorTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}') for i in range(24)
+        )
+        self.expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def test_cursor_walk(self):
+        """Курсоры проходят ленту вперёд и назад без пропусков и повторов."""
+        seen = []
+        cursor = ''
+        pages = []
+        while True:
+            cache.clear()
+            response = self.unauthorized_client.get(
+                self.index_url, {'cursor': cursor})
+            page = response.context['page']
+            pages.append(list(page.object_list))
+            seen.extend(page.object_list)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+        cache.clear()
+        response = self.unauthorized_client.get(
+            self.index_url, {'cursor': page.previous_cursor})
+        self.assertEqual(list(response.context['page'].object_list), pages[1])
+        self.assertTrue(response.context['page'].has_previous())
+
+    def test_no_count_query(self):
+        """Лента не выполняет COUNT(*) по постам."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.unauthorized_client.get(self.index_url)
+        self.assertFalse(
+            [q for q in queries if 'COUNT(*)' in q['sql']])
+
+    def test_invalid_cursor(self):
+        """Битый курсор открывает первую страницу."""
+        cache.clear()
+        response = self.unauthorized_client.get(
+            self.index_url, {'cursor': 'не-курсор'})
+        self.assertEqual(
+            list(response.context['page'].object_list), self.expected[:10])
+
+    def test_cursor_with_bad_values(self):
+        """Курсор с неверными значениями полей открывает первую страницу."""
+        for values in (['x', 'y'], ['2020-01-01 00:00:00', 'y']):
+            with self.subTest(values=values):
+                cache.clear()
+                cursor = base64.urlsafe_b64encode(
+                    json.dumps([0, *values]).encode()).decode().rstrip('=')
+                response = self.unauthorized_client.get(
+                    self.index_url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['page'].object_list),
+                                 self.expected[:10])
+
+
+class UsersDirectoryTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        User.objects.bulk_create(
+            User(username=f'reader{i:02}') for i in range(25))
+        self.users_url = reverse('users')
+        self.expected = list(
+            User.objects.order_by('username').values_list(
+                'username', flat=True))
+
+    def usernames(self, data=None):
+        response = self.unauthorized_client.get(self.users_url, data or {})
+        page = response.context['page']
+        return [user.username for user in page], page, response
+
+    def test_pages_and_letters(self):
+        """Каталог идёт страницами по имени и с переходом по буквам."""
+        first, page, response = self.usernames()
+        self.assertEqual(first, self.expected[:20])
+        self.assertEqual(response.context['letters'], ['C', 'G', 'W', 'r'])
+        self.assertIn('last_login', page[0].get_deferred_fields())
+        cache.clear()
+        second = self.usernames({'cursor': page.next_cursor})[0]
+        self.assertEqual(first + second, self.expected)
+        cache.clear()
+        jumped, page, _ = self.usernames({'from': 'W'})
+        self.assertEqual(jumped, self.expected[2:22])
+        self.assertTrue(page.has_previous())
+
+    def test_invalidation(self):
+        """Регистрация обновляет каталог, а вход на сайт - нет."""
+        self.usernames()
+        self.unauthorized_client.post(reverse('signup'), {
+            'username': 'Dandelion',
+            'password1': 'Ballad-of-Toss-1',
+            'password2': 'Ballad-of-Toss-1',
+        })
+        response = self.unauthorized_client.get(self.users_url)
+        self.assertContains(response, '@Dandelion')
+        version = generations('users')
+        self.client.login(username='Dandelion', password='Ballad-of-Toss-1')
+        self.assertEqual(generations('users'), version)
+
+
+class CommentsPageTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        Comment.objects.bulk_create(
+            Comment(post=self.post_user2, author=self.user,
+                    text=f'Комментарий {i}')
+            for i in range(45))
+        self.expected = list(
+            self.post_user2.comments.order_by('-created', '-id'))
+        self.args = [self.user2.username, self.post_user2.pk]
+
+    def test_pages(self):
+        """Пост показывает первые комментарии, фрагменты - следующие."""
+        response = self.unauthorized_client.get(
+            reverse('post', args=self.args))
+        page = response.context['comments']
+        seen = list(page)
+        self.assertEqual(seen, self.expected[:20])
+        self.assertContains(response, 'data-url="{}?cursor={}"'.format(
+            reverse('post_comments', args=self.args), page.next_cursor))
+        while page.has_next():
+            response = self.unauthorized_client.get(
+                reverse('post_comments', args=self.args),
+                {'cursor': page.next_cursor})
+            self.assertTemplateUsed(response, 'includes/comments_page.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            page = response.context['comments']
+            seen.extend(page)
+        self.assertEqual(seen, self.expected)
+        self.assertNotContains(response, 'load-comments')
+
+    def test_unknown_post(self):
+        """Фрагмент чужого или несуществующего поста - 404."""
+        response = self.unauthorized_client.get(reverse(
+            'post_comments', args=[self.user.username, self.post_user2.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTest(PreparationTests):
+    def revalidate(self, client, url, **headers):
+        """Повторный запрос с валидаторами первого ответа."""
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            again = client.get(url, **{
+                name: response[header] for name, header in headers.items()
+            })
+        return response, again, [query['sql'] for query in queries]
+
+    def test_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 без запросов к постам."""
+        pages = [
+            (self.unauthorized_client, reverse('index')),
+            (self.unauthorized_client,
+             reverse('profile', args=[self.user2.username])),
+            (self.unauthorized_client,
+             reverse('post', args=[self.user2.username, self.post_user2.pk])),
+            (self.authorized_client, reverse('follow_index')),
+        ]
+        for client, url in pages:
+            with self.subTest(url=url):
+                response, again, queries = self.revalidate(
+                    client, url, HTTP_IF_NONE_MATCH='ETag')
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again['ETag'], response['ETag'])
+                self.assertFalse(again.templates)
+                self.assertFalse([sql for sql in queries if 'posts_' in sql])
+
+    def test_if_modified_since(self):
+        """Без ETag страница сверяется по Last-Modified."""
+        url = reverse('post', args=[self.user2.username, self.post_user2.pk])
+        _, again, _ = self.revalidate(
+            self.unauthorized_client, url,
+            HTTP_IF_MODIFIED_SINCE='Last-Modified')
+        self.assertEqual(again.status_code, 304)
+
+    def test_changes(self):
+        """Комментарий, подписка и новый пост меняют валидаторы."""
+        post_url = reverse(
+            'post', args=[self.user2.username, self.post_user2.pk])
+        follow_url = reverse('follow_index')
+        etag = self.unauthorized_client.get(post_url)['ETag']
+        feed_etag = self.authorized_client.get(follow_url)['ETag']
+        Comment.objects.create(
+            post=self.post_user2, author=self.user, text='Комментарий')
+        response = self.unauthorized_client.get(
+            post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментарий')
+        Follow.objects.create(user=self.user, author=self.user2)
+        response = self.authorized_client.get(
+            follow_url, HTTP_IF_NONE_MATCH=feed_etag)
+        self.assertEqual(response.status_code, 200)
+        feed_etag = response['ETag']
+        Post.objects.create(text='Новый пост', author=self.user2)
+        response = self.authorized_client.get(
+            follow_url, HTTP_IF_NONE_MATCH=feed_etag)
+        self.assertContains(response, 'Новый пост')
+
+    def test_stale_copy(self):
+        """Копия, отданная во время пересчёта, несёт свои валидаторы."""
+        url = reverse('index')
+        etag = self.unauthorized_client.get(url)['ETag']
+        Post.objects.create(text='Свежая запись', author=self.user2)
+        cache.add(_key('index_page', (url,)) + ':lock', 1)
+        response = self.unauthorized_client.get(url)
+        self.assertNotContains(response, 'Свежая запись')
+        self.assertEqual(response['ETag'], etag)
+        cache.delete(_key('index_page', (url,)) + ':lock')
+        response = self.unauthorized_client.get(
+            url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Свежая запись')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_csrf_rotation(self):
+        """После повторного входа страница с формой приходит заново."""
+        url = reverse('post', args=[self.user2.username, self.post_user2.pk])
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        again = self.authorized_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_user_specific(self):
+        """Гость и пользователь получают разные ETag одной страницы."""
+        url = reverse('profile', args=[self.user2.username])
+        etag = self.unauthorized_client.get(url)['ETag']
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache, private')
+
+
+class CardCacheTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.post_user2.group = self.group
+        self.post_user2.save()
+        self.author_client = Client()
+        self.author_client.force_login(self.user2)
+        self.profile_url = reverse('profile', args=[self.user2.username])
+
+    def stale_text(self):
+        """Меняет текст в обход версии и сбрасывает кэш страниц."""
+        Post.objects.filter(pk=self.post_user2.pk).update(text='В обход')
+        Follow.objects.create(user=self.user, author=self.user2)
+
+    def test_shared_between_feeds_and_users(self):
+        """Карточку, отрисованную одной лентой, берут остальные."""
+        self.unauthorized_client.get(self.index_url)
+        self.stale_text()
+        for client, url in (
+                (self.unauthorized_client, self.profile_url),
+                (self.authorized_client, self.group_url),
+                (self.author_client, self.index_url)):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertContains(response, 'Новый пост Ciri')
+                self.assertNotContains(response, 'В обход')
+
+    def test_balanced_fragment(self):
+        """Кэшируется законченная разметка, а не половина карточки."""
+        self.unauthorized_client.get(self.index_url)
+        self.post_user2.refresh_from_db()
+        fragment = cache.get(make_template_fragment_key('post_card', [
+            self.post_user2.id, self.post_user2.version,
+            self.post_user2.pub_date,
+        ]))
+        self.assertIn('Новый пост Ciri', fragment)
+        for tag in ('div', 'p', 'a'):
+            with self.subTest(tag=tag):
+                self.assertEqual(len(re.findall(f'<{tag}[ >]', fragment)),
+                                 fragment.count(f'</{tag}>'))
+
+    def test_viewer_buttons(self):
+        """Кнопки автора не попадают в общую карточку."""
+        edit_url = reverse(
+            'post_edit', args=[self.user2.username, self.post_user2.pk])
+        self.assertContains(self.author_client.get(self.index_url), edit_url)
+        response = self.authorized_client.get(self.index_url)
+        self.assertNotContains(response, edit_url)
+        self.assertContains(response, 'Добавить комментарий')
+        response = self.unauthorized_client.get(self.index_url)
+        self.assertNotContains(response, 'Добавить комментарий')
+
+    def test_version(self):
+        """Правка, комментарий и смена группы обновляют карточку."""
+        self.unauthorized_client.get(self.profile_url)
+        self.authorized_client.post(
+            reverse('add_comment',
+                    args=[self.user2.username, self.post_user2.pk]),
+            {'text': 'Комментарий'})
+        self.assertContains(self.unauthorized_client.get(self.profile_url),
+                            'Комментариев: 1')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.unauthorized_client.get(self.profile_url),
+                            '#Новое название')
+        self.group.delete()
+        self.assertNotContains(
+            self.unauthorized_client.get(self.profile_url), '#Новое')
+        self.author_client.post(
+            reverse('post_edit',
+                    args=[self.user2.username, self.post_user2.pk]),
+            {'text': 'Исправленный текст'})
+        self.assertContains(self.unauthorized_client.get(self.profile_url),
+                            'Исправленный текст')
+
+
+class HolePunchingTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.user2)
+        self.profile_url = reverse('profile', args=[self.user2.username])
+        self.edit_url = reverse(
+            'post_edit', args=[self.user2.username, self.post_user2.pk])
+
+    def get(self, client, url):
+        """Страница из общего кэша: только сессия и пользователь."""
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertNotContains(response, '<!--hole')
+        self.assertNotContains(response, '<!--viewer')
+        return response, len(queries)
+
+    def test_shared_page(self):
+        """Одна копия ленты заполняется для каждого пользователя."""
+        response, _ = self.get(self.unauthorized_client, self.index_url)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Добавить комментарий')
+        response, queries = self.get(self.author_client, self.index_url)
+        self.assertEqual(queries, 2)
+        self.assertContains(response, self.edit_url)
+        self.assertContains(response, 'href="{}">{}</a>'.format(
+            self.profile_url, self.user2.username))
+        self.assertNotContains(response, 'Войти')
+        response, queries = self.get(self.authorized_client, self.index_url)
+        self.assertEqual(queries, 2)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, self.edit_url)
+        self.assertContains(response, self.user.username)
+
+    def test_follow_button(self):
+        """Кнопка подписки в общем профиле своя у каждого."""
+        unfollow = reverse('profile_unfollow', args=[self.user2.username])
+        follow = reverse('profile_follow', args=[self.user2.username])
+        cases = (
+            (self.authorized_client1, unfollow, follow),
+            (self.authorized_client, follow, unfollow),
+            (self.unauthorized_client, follow, unfollow),
+        )
+        for client, shown, hidden in cases:
+            with self.subTest(shown=shown):
+                response, _ = self.get(client, self.profile_url)
+                self.assertContains(response, shown)
+                self.assertNotContains(response, hidden)
+        response, _ = self.get(self.author_client, self.profile_url)
+        self.assertNotContains(response, follow)
+        self.assertNotContains(response, unfollow)
+
+    def test_uncached_pages(self):
+        """Страницы вне общего кэша выводят свой вариант сразу."""
+        url = reverse('post', args=[self.user2.username, self.post_user2.pk])
+        response, _ = self.get(self.author_client, url)
+        self.assertContains(response, self.edit_url)
+        response, _ = self.get(self.authorized_client1, url)
+        self.assertNotContains(response, self.edit_url)
+        self.assertContains(response, reverse(
+            'profile_unfollow', args=[self.user2.username]))
+
+
+class CommentsCountTest(PreparationTests):
+    def test_add_and_delete_comment(self):
+        """Счётчик комментариев меняется при добавлении и удалении."""
+        url = reverse('add_comment',
+                      args=[self.user2.username, self.post_user2.id])
+        self.authorized_client.post(url, {'text': 'Комментарий'})
+        self.authorized_client.post(url, {'text': 'Ещё комментарий'})
+        self.post_user2.refresh_from_db()
+        self.assertEqual(self.post_user2.comments_count, 2)
+        comment = Comment.objects.filter(post=self.post_user2).first()
+        self.authorized_client.get(reverse(
+            'delete_comment',
+            args=[self.user2.username, self.post_user2.id, comment.id]))
+        self.post_user2.refresh_from_db()
+        self.assertEqual(self.post_user2.comments_count, 1)
+
+    def test_recount_comments(self):
+        """Команда recount_comments чинит разошедшиеся счётчики."""
+        Comment.objects.create(
+            post=self.post_user2, author=self.user, text='Комментарий')
+        Post.objects.filter(pk=self.post_user2.pk).update(comments_count=7)
+        call_command('recount_comments', stdout=StringIO())
+        self.post_user2.refresh_from_db()
+        self.assertEqual(self.post_user2.comments_count, 1)
+
+
+class FeedTest(PreparationTests):
+    def feed_posts(self, client):
+        cache.clear()
+        return list(client.get(self.follow_url).context['page'])
+
+    def test_fan_out_on_write(self):
+        """Новый пост автора раскладывается в ленты подписчиков."""
+        post = Post.objects.create(author=self.user2, text='Для ленты')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user1, post=post).exists())
+        self.assertEqual(self.feed_posts(self.authorized_client1)[0], post)
+
+    def test_backfill_and_purge(self):
+        """Подписка заполняет ленту, отписка очищает её."""
+        self.authorized_client.get(
+            reverse('profile_follow', args=[self.user2.username]))
+        self.assertEqual(
+            self.feed_posts(self.authorized_client), [self.post_user2])
+        self.authorized_client.get(
+            reverse('profile_unfollow', args=[self.user2.username]))
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed_posts(self.authorized_client), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_celebrity_fan_out_on_read(self):
+        """Посты популярных авторов читаются без раскладки по лентам."""
+        post = Post.objects.create(author=self.user2, text='Знаменитость')
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        self.assertIn(post, self.feed_posts(self.authorized_client1))
+        self.assertEqual(self.feed_posts(self.authorized_client), [])
+
+    @override_settings(FEED_BACKFILL_LIMIT=2)
+    def test_rebuild(self):
+        """rebuild_feeds раскладывает последние посты каждого автора."""
+        posts = [Post.objects.create(author=self.user2, text=f'Пост {n}')
+                 for n in range(3)]
+        Follow.objects.create(user=self.user, author=self.user2)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        for user in (self.user, self.user1):
+            self.assertEqual(
+                set(FeedEntry.objects.filter(user=user).values_list(
+                    'post', flat=True)),
+                {posts[1].pk, posts[2].pk})
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pages_merge_celebrities(self):
+        """Страницы ленты сливают разложенные посты и посты знаменитостей."""
+        Follow.objects.create(user=self.user, author=self.user1)
+        Follow.objects.create(user=self.user, author=self.user2)
+        for number in range(12):
+            Post.objects.create(author=(self.user1, self.user2)[number % 2],
+                                text=f'Пост {number}')
+        expected = list(Post.objects.filter(
+            author__in=[self.user1, self.user2]).order_by('-pub_date', '-id'))
+        cache.clear()
+        pages = [self.authorized_client.get(self.follow_url).context['page']]
+        while pages[-1].has_next():
+            pages.append(self.authorized_client.get(
+                self.follow_url,
+                {'cursor': pages[-1].next_cursor}).context['page'])
+        self.assertEqual([post for page in pages for post in page], expected)
+        previous = self.authorized_client.get(
+            self.follow_url, {'cursor': pages[1].previous_cursor})
+        self.assertEqual(list(previous.context['page']), expected[:10])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_crossing_fanout_limit(self):
+        """Автор, перешедший FEED_FANOUT_LIMIT, меняет способ раздачи."""
+        self.authorized_client1.get(self.follow_url)
+        Follow.objects.create(user=self.user, author=self.user2)
+        self.assertFalse(
+            FeedEntry.objects.filter(post__author=self.user2).exists())
+        post = Post.objects.create(author=self.user2, text='Знаменитость')
+        for client in (self.authorized_client, self.authorized_client1):
+            response = client.get(self.follow_url)
+            self.assertEqual(list(response.context['page']),
+                             [post, self.post_user2])
+        Follow.objects.filter(user=self.user, author=self.user2).delete()
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.user1).values_list(
+                'post', flat=True)),
+            {post.pk, self.post_user2.pk})
+        response = self.authorized_client1.get(self.follow_url)
+        self.assertEqual(list(response.context['page']),
+                         [post, self.post_user2])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_celebrity_scope(self):
+        """Пост знаменитости сбрасывает ленты только её подписчиков."""
+        cache.clear()
+        self.authorized_client.get(self.follow_url)
+        self.authorized_client1.get(self.follow_url)
+        Post.objects.create(author=self.user2, text='Знаменитость')
+        self.authorized_client.get(self.follow_url)
+        self.assertEqual(stats('follow_feed')['hits'], 1)
+        response = self.authorized_client1.get(self.follow_url)
+        self.assertContains(response, 'Знаменитость')
+
+    @override_settings(FEED_MAX_ENTRIES=2)
+    def test_trim(self):
+        """В ленте остаются только FEED_MAX_ENTRIES последних постов."""
+        posts = [Post.objects.create(author=self.user2, text=f'Пост {n}')
+                 for n in range(3)]
+        Follow.objects.create(user=self.user, author=self.user2)
+        call_command('trim_feeds', stdout=StringIO())
+        for user in (self.user, self.user1):
+            self.assertEqual(
+                set(FeedEntry.objects.filter(user=user).values_list(
+                    'post', flat=True)),
+                {posts[1].pk, posts[2].pk})
+
+    def test_follow_feed_cache(self):
+        """Кэш ленты подписок общий для сессий пользователя и считает промахи."""
+        cache.clear()
+        self.authorized_client1.get(self.follow_url)
+        other_session = Client()
+        other_session.force_login(self.user1)
+        other_session.get(self.follow_url)
+        self.assertEqual(stats('follow_feed')['hits'], 1)
+        post = Post.objects.create(author=self.user2, text='Свежий пост')
+        response = self.authorized_client1.get(self.follow_url)
+        self.assertEqual(response.context['page'][0], post)
+        self.assertEqual(stats('follow_feed')['misses'], 2)
+
+
+class AuthorStatsTest(PreparationTests):
+    def test_counters(self):
+        """Счётчики автора следуют за постами и подписками."""
+        stats = AuthorStats.objects.get(user=self.user2)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user1).following_count, 1)
+        self.post_user2.delete()
+        self.follow.delete()
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (0, 0))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user1).following_count, 0)
+
+    def test_post_page_metadata(self):
+        """Страница поста берёт данные автора одним запросом."""
+        url = reverse('post', args=[self.user2.username, self.post_user2.id])
+        with self.assertNumQueries(2):
+            response = self.unauthorized_client.get(url)
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Записей: 1')
+
+    def test_rebuild_author_stats(self):
+        """Команда rebuild_author_stats чинит разошедшиеся счётчики."""
+        AuthorStats.objects.filter(user=self.user2).update(posts_count=9)
+        call_command('rebuild_author_stats', stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user2).posts_count, 1)
+
+
+class GroupStatsTest(PreparationTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.other = Group.objects.create(
+            title='Другая группа', slug='other', description='Вторая')
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_counters(self):
+        """Счётчики группы следуют за созданием, переносом и удалением."""
+        old = Post.objects.create(author=self.user, group=self.group,
+                                  text='Старый')
+        post = Post.objects.create(author=self.user, group=self.group,
+                                   text='Новый')
+        stats = self.stats(self.group)
+        self.assertEqual((stats.posts_count, stats.recent_posts), (2, 2))
+        self.assertEqual(stats.last_post_at, post.pub_date)
+        post.group = self.other
+        post.save()
+        self.assertEqual(self.stats(self.group).posts_count, 1)
+        self.assertEqual(self.stats(self.other).recent_posts, 1)
+        post.delete()
+        stats = self.stats(self.other)
+        self.assertEqual((stats.posts_count, stats.recent_posts), (0, 0))
+        self.assertIsNone(stats.last_post_at)
+        self.assertEqual(self.stats(self.group).last_post_at, old.pub_date)
+
+    def test_activity_window(self):
+        """Сдвиг окна убирает из недельного счётчика старые дни."""
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        GroupActivity.objects.create(
+            group=self.group, posts_count=5,
+            day=timezone.localdate() - timedelta(days=7))
+        GroupStats.objects.filter(group=self.group).update(recent_posts=6)
+        roll_activity()
+        self.assertEqual(self.stats(self.group).recent_posts, 1)
+        self.assertEqual(GroupActivity.objects.count(), 1)
+
+    def test_roll_on_read(self):
+        """Первый за день показ каталога сдвигает окно активности."""
+        GroupActivity.objects.create(
+            group=self.group, posts_count=5,
+            day=timezone.localdate() - timedelta(days=7))
+        GroupStats.objects.filter(group=self.group).update(recent_posts=5)
+        cache.clear()
+        response = self.unauthorized_client.get(reverse('groups'))
+        self.assertNotContains(response, 'за неделю: 5')
+        self.assertEqual(self.stats(self.group).recent_posts, 0)
+        self.assertFalse(GroupActivity.objects.exists())
+
+    def test_rebuild_group_stats(self):
+        """rebuild_group_stats восстанавливает счётчики по постам."""
+        Post.objects.create(author=self.user, group=self.other, text='Пост')
+        expected = list(GroupStats.objects.order_by('pk').values_list(
+            'posts_count', 'last_post_at', 'recent_posts'))
+        GroupStats.objects.all().delete()
+        GroupActivity.objects.all().delete()
+        call_command('rebuild_group_stats', stdout=StringIO())
+        self.assertEqual(list(GroupStats.objects.order_by('pk').values_list(
+            'posts_count', 'last_post_at', 'recent_posts')), expected)
+
+    def test_catalog(self):
+        """Каталог по умолчанию упорядочен по активности за неделю."""
+        Post.objects.create(author=self.user, group=self.other, text='Пост')
+        response = self.unauthorized_client.get(reverse('groups'))
+        self.assertEqual(list(response.context['page']),
+                         [self.other, self.group])
+        self.assertContains(response, 'за неделю: 1')
+        response = self.unauthorized_client.get(
+            reverse('groups'), {'sort': 'title'})
+        self.assertEqual(list(response.context['page']),
+                         [self.other, self.group])
+        self.assertEqual(response.context['query_string'], 'sort=title')
+
+    def test_slug_cache(self):
+        """Группа по slug читается из памяти до её изменения."""
+        self.assertEqual(group_by_slug('other'), self.other)
+        with self.assertNumQueries(0):
+            group_by_slug('other')
+        self.other.title = 'Переименованная'
+        self.other.save()
+        self.assertEqual(group_by_slug('other').title, 'Переименованная')
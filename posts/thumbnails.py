@@ -0,0 +1,75 @@
+"""
+Фоновая подготовка миниатюр картинок постов.
+
+Шаблоны больше не вызывают {% thumbnail %} при отрисовке: после
+сохранения поста задача в локальном пуле потоков готовит все размеры
+из THUMBNAIL_SIZES и записывает их адреса в Post.thumbnails. Пока
+нужного размера нет - задача ещё не выполнена или пост загружен до
+появления миниатюр, - шаблоны показывают исходную картинку, уже
+уменьшенную при загрузке (posts.images).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from sorl.thumbnail import get_thumbnail
+
+from .cache import bump
+from .models import Post
+from .signals import post_scopes
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix="thumbnails",
+            )
+    return _executor
+
+
+def generate(post_id):
+    """Готовит все миниатюры поста и сохраняет их адреса."""
+    post = Post.objects.filter(pk=post_id).only(
+        "image", "author", "group",
+    ).first()
+    if post is None or not post.image:
+        return
+    urls = {
+        alias: get_thumbnail(post.image, geometry, **options).url
+        for alias, (geometry, options) in settings.THUMBNAIL_SIZES.items()
+    }
+    # Если картинку успели заменить, её миниатюры подготовит
+    # следующая задача, а эти устарели.
+    updated = Post.objects.filter(
+        pk=post_id,
+        image=post.image.name,
+    ).update(thumbnails=urls, version=F("version") + 1)
+    if updated:
+        bump(*post_scopes(post))
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception("Не удалось подготовить миниатюры поста %s",
+                         post_id)
+    finally:
+        connections.close_all()
+
+
+def enqueue(post):
+    """Ставит подготовку миниатюр в очередь после фиксации транзакции."""
+    if post.image:
+        transaction.on_commit(lambda: executor().submit(_run, post.pk))
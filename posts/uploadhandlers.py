@@ -0,0 +1,46 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загрузку на диск кусками и перестаёт сохранять её, как только
+    она превысила POST_IMAGE_MAX_UPLOAD_SIZE. Остаток запроса дочитывается
+    и выбрасывается, а файл помечается too_large для формы.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            self.too_large = True
+        if self.too_large:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.too_large = self.too_large
+        return file
+
+
+def bounded_uploads(view):
+    """
+    Загрузки view идут через BoundedUploadHandler, остальные страницы
+    и админка - через обработчики по умолчанию. Обработчики меняются
+    до разбора тела, а CsrfViewMiddleware читала бы request.POST
+    раньше, поэтому CSRF проверяется здесь, после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [BoundedUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
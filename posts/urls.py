@@ -9,12 +9,17 @@ urlpatterns = [
     path('users/', views.users_all, name='users'),
     path('groups_all/', views.groups_all, name='groups'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
     path('<str:username>/', views.profile, name='profile'),
     path(
         '<str:username>/<int:post_id>/',
         views.post_view,
         name='post'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
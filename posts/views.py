@@ -1,24 +1,32 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Count
+from django.db.models import F
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
-from django.db import IntegrityError
-
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import search as search_index, thumbnails
+from .cache import (
+    cache_versioned, cached_fragment, conditional, generations,
+)
+from .feed import FeedPaginator, celebrities_followed_by
 from .forms import PostForm, CommentForm
+from .groups import group_by_slug, roll_daily
 from .models import Group, Post, User, Comment, Follow
+from .paginator import CursorPaginator
+from .uploadhandlers import bounded_uploads
 
 
-@cache_page(1 * 20, key_prefix="index_page")
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "index_page",
+                 lambda request: ("posts",))
 def index(request):
     post_list = Post.objects.all().select_related(
         'author', 'group'
-    ).annotate(
-        count_comments=Count('comments'),
-    ).order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    )
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
     return render(
         request,
         "index.html",
@@ -29,41 +37,138 @@ def index(request):
     )
 
 
-@cache_page(1 * 20, key_prefix="users_all")
+def first_letters():
+    """
+    Первые буквы имён пользователей по порядку. Каждая следующая
+    ищется одним проходом по индексу username от буквы после
+    предыдущей, поэтому таблица целиком не читается.
+    """
+    letters = []
+    usernames = User.objects.order_by("username").values_list(
+        "username", flat=True)
+    username = usernames.first()
+    while username:
+        letters.append(username[0])
+        username = usernames.filter(
+            username__gte=chr(ord(username[0]) + 1)).first()
+    return letters
+
+
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "users_all",
+                 lambda request: ("users",))
 def users_all(request):
-    users = User.objects.all().order_by("username")
+    users = User.objects.only(
+        "username", "first_name", "last_name", "is_staff", "date_joined")
+    paginator = CursorPaginator(users, 20, ordering=("username",))
+    start = request.GET.get("from", "")[:150]
+    if start and not request.GET.get("cursor"):
+        page = paginator.page_from(start)
+    else:
+        page = paginator.get_page(request.GET.get("cursor"))
+    # Страницы каталога общие для всех и меняются только с составом
+    # пользователей, а не при каждом входе на сайт.
+    version = generations("users")
+    page.rows = cached_fragment(
+        "users_page",
+        (page.values, page.reverse, page.inclusive),
+        version,
+        lambda: page.rows,
+        settings.PAGE_CACHE_TIMEOUT,
+    )
     return render(
         request,
         "users.html",
         {
-            "users": users,
+            "page": page,
+            "paginator": paginator,
+            "letters": cached_fragment(
+                "users_letters", (), version, first_letters,
+                settings.PAGE_CACHE_TIMEOUT),
         },
     )
 
 
-@cache_page(1 * 60, key_prefix="groups_all")
+# Сортировки каталога групп: название в меню и порядок строк.
+GROUP_SORTS = {
+    "activity": ("За неделю", (
+        F("stats__recent_posts").desc(nulls_last=True),
+        F("stats__last_post_at").desc(nulls_last=True),
+        "title",
+    )),
+    "recent": ("Недавние", (
+        F("stats__last_post_at").desc(nulls_last=True), "title",
+    )),
+    "posts": ("Больше записей", (
+        F("stats__posts_count").desc(nulls_last=True), "title",
+    )),
+    "title": ("По названию", ("title",)),
+}
+
+
+def groups_scopes(request):
+    """
+    Поколение каталога групп. Первый за день запрос каталога сдвигает
+    окно активности, даже если в группы давно никто не писал.
+    """
+    roll_daily()
+    return ("groups",)
+
+
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "groups_all", groups_scopes)
 def groups_all(request):
-    groups = Group.objects.all()
+    sort = request.GET.get("sort")
+    if sort not in GROUP_SORTS:
+        sort = "activity"
+    groups = Group.objects.select_related("stats").order_by(
+        *GROUP_SORTS[sort][1])
+    paginator = Paginator(groups, 20)
+    page = paginator.get_page(request.GET.get("page"))
     return render(
         request,
         "groups.html",
         {
-            "groups": groups,
+            "page": page,
+            "paginator": paginator,
+            "sort": sort,
+            "sorts": {name: title for name, (title, _) in GROUP_SORTS.items()},
+            "query_string": urlencode({"sort": sort}),
         },
     )
 
 
-@cache_page(1 * 20, key_prefix="group_page")
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "search_page",
+                 lambda request: ("posts",))
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = Paginator(search_index.search(query) if query else [], 10)
+    page = paginator.get_page(request.GET.get("page"))
+    posts = Post.objects.select_related(
+        'author', 'group'
+    ).in_bulk(page.object_list)
+    page.object_list = [
+        posts[pk] for pk in page.object_list if pk in posts
+    ]
+    return render(
+        request,
+        "search.html",
+        {
+            "query": query,
+            "query_string": urlencode({"q": query}),
+            "page": page,
+            "paginator": paginator,
+        },
+    )
+
+
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "group_page",
+                 lambda request, slug: (f"group:{slug}",))
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.prefetch_related(
+    group = group_by_slug(slug)
+    posts_list = group.posts.select_related(
         'author', 'group'
-    ).all().annotate(
-        count_comments=Count('comments'),
-    ).order_by('-pub_date')
-    paginator = Paginator(posts_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    ).all()
+    paginator = CursorPaginator(posts_list, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
     return render(
         request,
         "group.html",
@@ -76,6 +181,7 @@ def group_posts(request, slug):
 
 
 @login_required()
+@bounded_uploads
 def new_post(request):
     new_title = "Новая запись"
     new_button = "Добавить"
@@ -86,6 +192,7 @@ def new_post(request):
         create_post = form.save(commit=False)
         create_post.author = request.user
         create_post.save()
+        thumbnails.enqueue(create_post)
         return redirect("index")
     return render(
         request,
@@ -99,23 +206,20 @@ def new_post(request):
     )
 
 
+@cache_versioned(settings.PAGE_CACHE_TIMEOUT, "profile_page",
+                 lambda request, username: (
+                     f"profile:{username}", "group_slugs"))
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username,
+    )
     post_list = Post.objects.select_related(
         'author',
         'group',
-    ).filter(author=author).annotate(
-        count_comments=Count('comments'),
-    ).order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    subscribers = Follow.objects.filter(author=author).count()
-    signed = Follow.objects.filter(user=author).count()
-    following = False
-    if request.user.is_authenticated:
-        if Follow.objects.filter(user=request.user, author=author).exists():
-            following = True
+    ).filter(author=author)
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
     return render(
         request,
         "profile.html",
@@ -123,61 +227,95 @@ def profile(request, username):
             "author": author,
             "page": page,
             "paginator": paginator,
-            "subscribers": subscribers,
-            "signed": signed,
-            "following": following,
         },
     )
 
 
+COMMENTS_PER_PAGE = 20
+
+
+def comments_page(post, cursor):
+    """Страница комментариев поста, от новых к старым."""
+    comments = Comment.objects.select_related("author").filter(post=post)
+    return CursorPaginator(
+        comments, COMMENTS_PER_PAGE, ordering=("-created", "-id"),
+    ).get_page(cursor)
+
+
+def post_page_scopes(request, username, post_id):
+    """
+    Поколения страницы поста: сам пост с комментариями, карточка
+    автора с кнопкой подписки и названия групп.
+    """
+    return (f"post:{post_id}", f"profile:{username}", "group_slugs")
+
+
+@conditional(post_page_scopes)
 def post_view(request, username, post_id):
-    username = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id, author=username)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        id=post_id,
+        author__username=username,
+    )
     author = post.author
-    posts = Post.objects.filter(author=author).count()
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.prefetch_related(
-        'author',
-    ).filter(
-        post=post
-    )
-    subscribers = Follow.objects.filter(author=username).count()
-    signed = Follow.objects.filter(user=username).count()
-    following = False
-    if request.user.is_authenticated:
-        if Follow.objects.filter(user=request.user, author=username).exists():
-            following = True
     return render(
         request,
         "post.html",
         {
             "post": post,
             "author": author,
-            "posts": posts,
             "form": form,
-            "comments": comments,
-            "subscribers": subscribers,
-            "signed": signed,
-            "following": following,
+            "comments": comments_page(post, request.GET.get("cursor")),
         }
     )
 
 
+@conditional(lambda request, username, post_id: (f"post:{post_id}",))
+def post_comments(request, username, post_id):
+    """Следующая страница комментариев HTML-фрагментом для подгрузки."""
+    post = get_object_or_404(
+        Post.objects.select_related("author").only(
+            "id", "author__username"),
+        id=post_id,
+        author__username=username,
+    )
+    return render(
+        request,
+        "includes/comments_page.html",
+        {
+            "post": post,
+            "author": post.author,
+            "comments": comments_page(post, request.GET.get("cursor")),
+        },
+    )
+
+
 @login_required()
+@bounded_uploads
 def post_edit(request, username, post_id):
     edit_title = "Редактирование записи"
     edit_button = "Сохранить"
     edit_header = "Редактировать запись"
-    username = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=username)
-    if post.author != request.user:
-        return redirect("post", username=post.author, post_id=post.pk)
+    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    if post.author_id != request.user.pk:
+        return redirect("post", username=username, post_id=post.pk)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        post.save()
-        return redirect("post", username=post.author, post_id=post.pk)
+        # Сохраняются только поля формы, которые изменились: счётчик
+        # комментариев и миниатюры, записанные F() после загрузки
+        # поста, не перезаписываются.
+        fields = list(form.changed_data)
+        image_changed = 'image' in fields
+        if image_changed:
+            post.thumbnails = {}
+            fields.append("thumbnails")
+        post.save(update_fields=fields)
+        if image_changed:
+            thumbnails.enqueue(post)
+        return redirect("post", username=username, post_id=post.pk)
     return render(
         request,
         "new_post.html",
@@ -193,47 +331,86 @@ def post_edit(request, username, post_id):
 
 @login_required()
 def post_delete(request, username, post_id):
-    username = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=username)
+    post = get_object_or_404(Post, pk=post_id, author__username=username)
     post.delete()
     return redirect("profile", username=username)
 
 
 @login_required()
 def add_comment(request, username, post_id):
-    user_profile = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=user_profile)
+    post = get_object_or_404(Post, pk=post_id, author__username=username)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         new_comment = form.save(commit=False)
         new_comment.author = request.user
         new_comment.post = post
-        new_comment.save()
-        return redirect("post", username=post.author, post_id=post.pk)
-    return redirect("post", username=post.author, post_id=post.pk)
+        with transaction.atomic():
+            new_comment.save()
+            Post.objects.filter(pk=post.pk).update(
+                comments_count=F('comments_count') + 1,
+                version=F('version') + 1,
+            )
+        return redirect("post", username=username, post_id=post.pk)
+    return redirect("post", username=username, post_id=post.pk)
 
 
 @login_required()
 def delete_comment(request, username, post_id, comment_id):
     comment = get_object_or_404(Comment, id=comment_id)
-    comment.delete()
+    with transaction.atomic():
+        deleted, _ = Comment.objects.filter(pk=comment.pk).delete()
+        if deleted:
+            Post.objects.filter(
+                pk=comment.post_id,
+                comments_count__gt=0,
+            ).update(comments_count=F('comments_count') - 1,
+                     version=F('version') + 1)
     return redirect("post", username=username, post_id=post_id)
 
 
+def followed_celebrities(request):
+    """
+    id знаменитостей из подписок пользователя. Список хранится в кэше
+    до смены поколения его подписок.
+    """
+    user = request.user
+    return cached_fragment(
+        "followed_celebrities",
+        (user.pk,),
+        generations(f"follow:{user.pk}"),
+        lambda: list(celebrities_followed_by(user).values_list(
+            "author", flat=True)),
+        settings.PAGE_CACHE_TIMEOUT,
+    )
+
+
+def follow_scopes(request):
+    """
+    Поколения ленты подписок пользователя, постов знаменитостей
+    из неё и названий групп.
+    """
+    return (
+        f"follow:{request.user.pk}",
+        *(f"celebrity:{pk}" for pk in followed_celebrities(request)),
+        "group_slugs",
+    )
+
+
 @login_required
-@cache_page(1 * 20, key_prefix="index_page")
+@conditional(follow_scopes)
 def follow_index(request):
-    posts = Post.objects.select_related(
-        'author',
-        'group',
-    ).filter(
-        author__following__user=request.user
-    ).annotate(
-        count_comments=Count('comments'),
-    ).order_by('-pub_date')
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    paginator = FeedPaginator(
+        request.user, 10, followed_celebrities(request))
+    page = paginator.get_page(request.GET.get("cursor"))
+    # Лента кэшируется по пользователю и поколению его подписок,
+    # а не по cookie сессии, как делал cache_page.
+    page.rows = cached_fragment(
+        "follow_feed",
+        (request.user.pk, page.values, page.reverse),
+        generations(*follow_scopes(request)),
+        lambda: page.rows,
+        settings.PAGE_CACHE_TIMEOUT,
+    )
     return render(
         request,
         "follow.html",
@@ -0,0 +1,274 @@
+"""
+Кэш в файле SQLite, общий для всех процессов одного хоста.
+
+В отличие от LocMemCache, копия страницы хранится один раз на хост,
+а не в каждом воркере. Размер ограничен числом записей (MAX_ENTRIES)
+и суммарным объёмом значений в байтах (MAX_SIZE); при переполнении
+вытесняются давно не читавшиеся записи (LRU). Счётчики записей и
+объёма ведут триггеры, поэтому проверка переполнения не сканирует
+таблицу.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_totals VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_totals SET entries = entries + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_totals SET entries = entries - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_totals SET size = size - OLD.size + NEW.size;
+END;
+"""
+
+# Время чтения обновляется не чаще раза в столько секунд,
+# чтобы каждое попадание не превращалось в запись.
+ACCESS_RESOLUTION = 1.0
+# Старые сборки SQLite принимают не больше 999 параметров в запросе.
+MAX_VARIABLES = 500
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._location = location
+        self._max_size = int(options.get("MAX_SIZE", 0)) or None
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение SQLite нельзя наследовать через fork, поэтому
+        # оно привязано к потоку и к процессу.
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(
+                self._location,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    def _expiry(self, timeout):
+        # get_backend_timeout уже возвращает абсолютное время истечения.
+        return self.get_backend_timeout(timeout)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _read(self, db, keys, now):
+        """
+        Живые значения keys. Вне транзакции чтение не берёт блокировку
+        записи, а отметки LRU и удаление просроченного делаются
+        отдельными короткими запросами.
+        """
+        keys = list(keys)
+        rows = []
+        for start in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[start:start + MAX_VARIABLES]
+            rows += db.execute(
+                "SELECT key, value, expires, accessed FROM cache "
+                "WHERE key IN (%s)" % ", ".join("?" * len(chunk)),
+                chunk,
+            ).fetchall()
+        found, expired, touched = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append((key, expires))
+                continue
+            found[key] = value
+            if now - accessed > ACCESS_RESOLUTION:
+                touched.append((now, key))
+        if expired:
+            db.executemany(
+                "DELETE FROM cache WHERE key = ? AND expires = ?", expired)
+        if touched:
+            db.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?", touched)
+        return found
+
+    def _write(self, db, key, value, timeout, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        db.execute(
+            "INSERT INTO cache (key, value, size, expires, accessed) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "value = excluded.value, size = excluded.size, "
+            "expires = excluded.expires, accessed = excluded.accessed",
+            (key, data, len(data), self._expiry(timeout), now),
+        )
+
+    def _cull(self, db, now):
+        entries, size = db.execute(
+            "SELECT entries, size FROM cache_totals").fetchone()
+        over_size = self._max_size is not None and size > self._max_size
+        if entries <= self._max_entries and not over_size:
+            return
+        db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        entries, size = db.execute(
+            "SELECT entries, size FROM cache_totals").fetchone()
+        if entries > self._max_entries:
+            if self._cull_frequency == 0:
+                db.execute("DELETE FROM cache")
+                return
+            db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY accessed, rowid LIMIT ?)",
+                (max(entries // self._cull_frequency, 1),),
+            )
+            entries, size = db.execute(
+                "SELECT entries, size FROM cache_totals").fetchone()
+        if self._max_size is None or size <= self._max_size:
+            return
+        target = self._max_size
+        if self._cull_frequency:
+            target -= self._max_size // self._cull_frequency
+        # Старейшие записи, суммарно покрывающие превышение объёма.
+        db.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM ("
+            "SELECT key, size, SUM(size) OVER (ORDER BY accessed, rowid) "
+            "AS running FROM cache) WHERE running - size < ?)",
+            (size - target,),
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._read(self._db, [key], time.time())
+        return pickle.loads(found[key]) if key in found else default
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._read(self._db, keys, time.time())
+        return {
+            keys[key]: pickle.loads(value) for key, value in found.items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            self._write(db, key, value, timeout, now)
+            self._cull(db, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._transaction() as db:
+            for key, value in data.items():
+                self._write(db, self._key(key, version), value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            if self._read(db, [key], now):
+                return False
+            self._write(db, key, value, timeout, now)
+            self._cull(db, now)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            found = self._read(db, [key], now)
+            if not found:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(found[key]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                "UPDATE cache SET value = ?, size = ? WHERE key = ?",
+                (data, len(data), key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE cache SET expires = ? WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (self._expiry(timeout), key, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        with self._transaction() as db:
+            for key in keys:
+                db.execute(
+                    "DELETE FROM cache WHERE key = ?",
+                    (self._key(key, version),),
+                )
+
+    def clear(self):
+        self._db.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединение живёт всё время жизни потока: открывать файл
+        # и выполнять PRAGMA на каждый запрос дороже самого чтения.
+        pass
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: атомарность add и incr между процессами."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
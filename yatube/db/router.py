@@ -0,0 +1,137 @@
+"""
+Чтение лент с реплик с учётом их отставания.
+
+Все базы из DATABASES, кроме default, считаются репликами default.
+Запись и чтение по умолчанию идут в default. ReplicaMiddleware
+отправляет на реплику чтения GET-страниц из REPLICA_VIEWS - лент,
+где отставание на секунды незаметно. Реплика выбирается случайно
+среди тех, что отстают не больше REPLICA_MAX_LAG секунд, и не
+меняется до конца страницы.
+
+Отставание сообщает процесс репликации через report_synced (так
+делает команда replicate_sqlite); реплика, о которой ничего не
+известно, не используется. REPLICA_MAX_LAG = None отключает проверку.
+
+После запроса, который что-то записал, пользователь получает cookie
+на REPLICA_PIN_SECONDS, и пока она жива, все его чтения идут в
+default: он сразу видит свой пост, комментарий или подписку. Если
+срок cookie не меньше REPLICA_MAX_LAG, то к её истечению любая
+допустимая реплика уже содержит эту запись.
+
+Страница, прочитанная с реплики, которая ещё не получила последнюю
+запись сайта, не кладётся в кэш страниц (stale_read): иначе старые
+данные остались бы в кэше под новым поколением.
+"""
+import math
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY = "default"
+PIN_COOKIE = "read_primary"
+LAST_WRITE_KEY = "replica:last_write"
+SYNCED_KEY = "replica:synced:{}"
+
+
+class _RequestState:
+    __slots__ = ("replica", "stale", "wrote")
+
+    def __init__(self):
+        self.replica = None
+        self.stale = False
+        self.wrote = False
+
+
+_state = ContextVar("replica_state", default=None)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+def report_synced(alias, synced_at):
+    """Реплика alias содержит все записи default до момента synced_at."""
+    cache.set(SYNCED_KEY.format(alias), synced_at, None)
+
+
+def choose_replica(pool):
+    """(реплика или None, отстаёт ли она от последней записи)."""
+    max_lag = settings.REPLICA_MAX_LAG
+    if max_lag is None:
+        return random.choice(pool), False
+    found = cache.get_many(
+        [LAST_WRITE_KEY] + [SYNCED_KEY.format(alias) for alias in pool])
+    now = time.time()
+    fresh = [
+        alias for alias in pool
+        if now - found.get(SYNCED_KEY.format(alias), -math.inf) <= max_lag
+    ]
+    if not fresh:
+        return None, False
+    alias = random.choice(fresh)
+    return alias, (found[SYNCED_KEY.format(alias)]
+                   < found.get(LAST_WRITE_KEY, -math.inf))
+
+
+def stale_read():
+    """Текущая страница читает реплику, отстающую от последней записи."""
+    state = _state.get()
+    return state is not None and state.stale
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica:
+            return state.replica
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в default.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от default.
+        return db == PRIMARY
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            cache.set(LAST_WRITE_KEY, time.time(), None)
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=math.ceil(settings.REPLICA_PIN_SECONDS),
+                httponly=True, samesite="Lax")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if (state is None
+                or request.method not in ("GET", "HEAD")
+                or request.resolver_match.url_name
+                not in settings.REPLICA_VIEWS
+                or PIN_COOKIE in request.COOKIES):
+            return None
+        state.replica, state.stale = choose_replica(replicas())
+        return None
@@ -0,0 +1,56 @@
+"""
+SQLite с настройками для нескольких одновременных писателей.
+
+Стандартный бэкенд открывает базу в режиме журнала DELETE: запись
+блокирует и читателей, а второй писатель сразу получает "database is
+locked". Здесь при каждом подключении включаются WAL (читатели не
+мешают писателю), synchronous=NORMAL (fsync только на контрольных
+точках WAL), отображение файла в память и ожидание блокировки
+busy_timeout. Транзакции atomic() начинаются с BEGIN IMMEDIATE: так
+писатель ждёт блокировку в начале транзакции, а не получает ошибку
+при переходе от чтения к записи, где busy_timeout не помогает.
+
+Значения берутся из OPTIONS базы: "pragmas" дополняет и заменяет
+PRAGMAS, "transaction_mode" - режим BEGIN (DEFERRED, IMMEDIATE или
+EXCLUSIVE).
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 ** 2,
+    "busy_timeout": 5000,
+}
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop("pragmas", None)
+        kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    @property
+    def pragmas(self):
+        return {**PRAGMAS, **self.settings_dict["OPTIONS"].get("pragmas", {})}
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict["OPTIONS"].get(
+            "transaction_mode", "IMMEDIATE").upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode должен быть одним из {TRANSACTION_MODES}")
+        return mode
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
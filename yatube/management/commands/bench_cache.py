@@ -0,0 +1,88 @@
+import bisect
+import itertools
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from yatube.cache_backends import SQLiteCache
+
+
+def make_cache(backend, location, max_entries):
+    params = {"TIMEOUT": None, "OPTIONS": {"MAX_ENTRIES": max_entries}}
+    if backend == "locmem":
+        return LocMemCache(f"bench-{os.getpid()}", params)
+    return SQLiteCache(location, params)
+
+
+def run_worker(backend, location, max_entries, keys, requests, size, seed):
+    """Один воркер: чтение страницы, при промахе - запись."""
+    cache = make_cache(backend, location, max_entries)
+    rnd = random.Random(seed)
+    # Популярность страниц по закону Ципфа: немногие страницы
+    # (первые страницы лент) получают большую часть запросов.
+    weights = list(itertools.accumulate(1 / rank for rank in
+                                        range(1, keys + 1)))
+    payload = b"x" * size
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        page = bisect.bisect(weights, rnd.random() * weights[-1])
+        key = f"page:{page}"
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.set(key, payload)
+    return hits, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает долю попаданий и пропускную способность кэшей "
+        "LocMem и SQLite при разном числе процессов-воркеров."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+        parser.add_argument(
+            "--backends", nargs="+", default=["locmem", "sqlite"],
+            choices=["locmem", "sqlite"])
+        parser.add_argument(
+            "--requests", type=int, default=20000,
+            help="Всего запросов, делится между воркерами.")
+        parser.add_argument("--keys", type=int, default=5000)
+        parser.add_argument("--max-entries", type=int, default=2000)
+        parser.add_argument("--size", type=int, default=20 * 1024)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        self.stdout.write(
+            f"{'кэш':<8}{'воркеров':>10}{'попаданий':>12}{'запросов/с':>14}")
+        for backend, workers in itertools.product(
+                options["backends"], options["workers"]):
+            with tempfile.TemporaryDirectory() as directory:
+                location = os.path.join(directory, "cache.sqlite3")
+                # Схема создаётся до запуска воркеров, чтобы они
+                # не гонялись за её создание.
+                make_cache(backend, location, options["max_entries"]).get(
+                    "warmup")
+                per_worker = options["requests"] // workers
+                jobs = [
+                    (backend, location, options["max_entries"],
+                     options["keys"], per_worker, options["size"], seed)
+                    for seed in range(workers)
+                ]
+                started = time.perf_counter()
+                with context.Pool(workers) as pool:
+                    results = pool.starmap(run_worker, jobs)
+                elapsed = time.perf_counter() - started
+            hits = sum(hit for hit, _ in results)
+            total = per_worker * workers
+            self.stdout.write(
+                f"{backend:<8}{workers:>10}{hits / total:>12.1%}"
+                f"{total / elapsed:>14.0f}")
@@ -0,0 +1,223 @@
+import bisect
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+from urllib.parse import unquote, urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY,
+)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+# Доли видов запросов в смеси: чтение лент и постов преобладает.
+TRAFFIC_MIX = {
+    "index": 30,
+    "post": 25,
+    "profile": 15,
+    "group": 10,
+    "follow_index": 8,
+    "search": 5,
+    "add_comment": 4,
+    "new_post": 2,
+    "users": 1,
+}
+WRITE_VIEWS = ("add_comment", "new_post")
+SEARCH_WORDS = ("кот", "книга", "город", "море", "музыка", "дорога")
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Traffic:
+    """Строит запросы смеси из случайных объектов базы."""
+
+    def __init__(self, sample, writes):
+        self.users = list(User.objects.order_by("?").values_list(
+            "pk", "username")[:sample])
+        self.posts = list(Post.objects.order_by("?").values_list(
+            "pk", "author__username")[:sample])
+        self.groups = list(Group.objects.order_by("?").values_list(
+            "slug", flat=True)[:sample])
+        if not (self.users and self.posts):
+            raise CommandError(
+                "База пуста: заполните её командой seed_yatube.")
+        self.sessions = {pk: self.login(pk) for pk, _ in self.users}
+        mix = {
+            view: weight for view, weight in TRAFFIC_MIX.items()
+            if (writes or view not in WRITE_VIEWS)
+            and (view != "group" or self.groups)
+        }
+        self.views = list(mix)
+        self.weights = list(itertools.accumulate(mix.values()))
+
+    @staticmethod
+    def login(user_pk):
+        """Cookie сессии вошедшего пользователя, как Client.force_login."""
+        user = User.objects.get(pk=user_pk)
+        session = SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def next(self, rnd):
+        """(вид, метод, путь, query string, данные формы, id сессии)."""
+        view = self.views[bisect.bisect(
+            self.weights, rnd.random() * self.weights[-1])]
+        user_pk, username = rnd.choice(self.users)
+        post_pk, author = rnd.choice(self.posts)
+        session = self.sessions[user_pk]
+        if view == "post":
+            return view, "GET", reverse("post", args=[author, post_pk]), \
+                "", None, None
+        if view == "profile":
+            return view, "GET", reverse("profile", args=[username]), \
+                "", None, None
+        if view == "group":
+            return view, "GET", reverse(
+                "group", args=[rnd.choice(self.groups)]), "", None, None
+        if view == "search":
+            return view, "GET", reverse("search"), urlencode(
+                {"q": rnd.choice(SEARCH_WORDS)}), None, None
+        if view == "follow_index":
+            return view, "GET", reverse("follow_index"), "", None, session
+        if view == "add_comment":
+            return view, "POST", reverse(
+                "add_comment", args=[author, post_pk]), "", {
+                "text": "Нагрузочный комментарий"}, session
+        if view == "new_post":
+            return view, "POST", reverse("new_post"), "", {
+                "text": "Нагрузочная запись"}, session
+        return view, "GET", reverse(view), "", None, None
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест: потоки вызывают WSGI-приложение yatube.wsgi "
+        "смесью запросов к лентам, постам, поиску и записи и выводят "
+        "пропускную способность и перцентили задержки по видам страниц."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--duration", type=float, default=30,
+            help="Длительность замера в секундах.")
+        parser.add_argument(
+            "--warmup", type=float, default=3,
+            help="Сколько секунд до замера прогревать кэш.")
+        parser.add_argument(
+            "--sample", type=int, default=500,
+            help="Сколько пользователей, постов и групп брать в смесь.")
+        parser.add_argument(
+            "--read-only", action="store_true",
+            help="Не отправлять комментарии и новые посты.")
+        parser.add_argument("--host", default="localhost")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        from yatube.wsgi import application
+
+        self.application = application
+        self.host = options["host"]
+        traffic = Traffic(options["sample"], not options["read_only"])
+        # get_token кладёт значение cookie в META запроса и возвращает
+        # маскированный токен для заголовка X-CSRFToken.
+        request = HttpRequest()
+        self.csrf_token = get_token(request)
+        self.csrf_cookie = request.META["CSRF_COOKIE"]
+        results = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        warmup_until = time.monotonic() + options["warmup"]
+        deadline = warmup_until + options["duration"]
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    view, *request = traffic.next(rnd)
+                    started = time.perf_counter()
+                    status = self.call(*request)
+                    elapsed = time.perf_counter() - started
+                    if time.monotonic() < warmup_until:
+                        continue
+                    with lock:
+                        results[view].append(elapsed)
+                        if status >= 400:
+                            errors[view] += 1
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(options["seed"] + number,))
+            for number in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.report(results, errors, options["duration"])
+
+    def call(self, method, path, query, data, session):
+        """Один запрос к WSGI-приложению; возвращает код ответа."""
+        body = urlencode(data or {}).encode()
+        environ = {
+            "REQUEST_METHOD": method,
+            # WSGI передаёт путь байтами UTF-8, прочитанными как latin-1.
+            "PATH_INFO": unquote(path).encode().decode("iso-8859-1"),
+            "QUERY_STRING": query,
+            "HTTP_HOST": self.host,
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": BytesIO(body),
+        }
+        cookies = {settings.CSRF_COOKIE_NAME: self.csrf_cookie}
+        if session:
+            cookies[settings.SESSION_COOKIE_NAME] = session
+        environ["HTTP_COOKIE"] = "; ".join(
+            f"{name}={value}" for name, value in cookies.items())
+        if method == "POST":
+            environ["CONTENT_TYPE"] = "application/x-www-form-urlencoded"
+            environ["HTTP_X_CSRFTOKEN"] = self.csrf_token
+        setup_testing_defaults(environ)
+        status = []
+        response = self.application(
+            environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        return int(status[0].split()[0])
+
+    def report(self, results, errors, duration):
+        self.stdout.write(
+            f"{'страница':<14}{'запросов':>9}{'в секунду':>11}{'ошибок':>8}"
+            f"{'p50, мс':>9}{'p90, мс':>9}{'p99, мс':>9}{'max, мс':>9}")
+        total = 0
+        for view in sorted(results, key=lambda view: -len(results[view])):
+            timings = sorted(results[view])
+            total += len(timings)
+            self.stdout.write(
+                f"{view:<14}{len(timings):>9}{len(timings) / duration:>11.1f}"
+                f"{errors[view]:>8}"
+                + "".join(f"{percentile(timings, share) * 1000:>9.1f}"
+                          for share in (0.5, 0.9, 0.99))
+                + f"{timings[-1] * 1000:>9.1f}")
+        self.stdout.write(f"Всего: {total} запросов, "
+                          f"{total / duration:.1f} в секунду")
@@ -0,0 +1,135 @@
+import json
+import os
+import pstats
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Литералы в SQL заменяются на ?, чтобы запросы одного вида сложились.
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    return SQL_LITERALS.sub("?", " ".join(sql.split()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сводка по снимкам yatube.profiling: самые медленные страницы, "
+        "функции с наибольшим собственным и полным временем по дампам "
+        "cProfile и стекам, и самые дорогие виды SQL-запросов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir", default=None,
+            help="Каталог снимков, по умолчанию PROFILING_DIR.")
+        parser.add_argument(
+            "--top", type=int, default=20,
+            help="Сколько строк выводить в каждом разделе.")
+        parser.add_argument(
+            "--view", action="append",
+            help="Учитывать только эти страницы (можно повторять).")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or settings.PROFILING_DIR
+        self.top = options["top"]
+        snapshots = self.load(directory, options["view"])
+        if not snapshots:
+            raise CommandError(f"В {directory} нет снимков.")
+        self.report_views(snapshots)
+        profiles = [base + ".prof" for base, meta in snapshots
+                    if meta["kind"] == "cprofile"]
+        if profiles:
+            self.report_profiles(profiles)
+        stacks = [base + ".folded" for base, meta in snapshots
+                  if meta["kind"] == "stacks"]
+        if stacks:
+            self.report_stacks(stacks)
+        self.report_sql(snapshots)
+
+    def load(self, directory, views):
+        if not os.path.isdir(directory):
+            return []
+        snapshots = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            base = os.path.join(directory, name[:-len(".json")])
+            with open(base + ".json") as meta_file:
+                meta = json.load(meta_file)
+            if not views or meta["view"] in views:
+                snapshots.append((base, meta))
+        return snapshots
+
+    def section(self, title):
+        self.stdout.write("")
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+
+    def report_views(self, snapshots):
+        seconds = defaultdict(list)
+        for _, meta in snapshots:
+            seconds[meta["view"]].append(meta["seconds"])
+        self.section("Страницы")
+        self.stdout.write(
+            f"{'страница':<20}{'снимков':>8}{'среднее, мс':>13}"
+            f"{'max, мс':>9}")
+        for view, values in sorted(
+                seconds.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(
+                f"{view:<20}{len(values):>8}"
+                f"{sum(values) / len(values) * 1000:>13.1f}"
+                f"{max(values) * 1000:>9.1f}")
+
+    def report_profiles(self, paths):
+        stats = pstats.Stats(*paths).stats
+        for key, title in ((2, "собственное"), (3, "полное")):
+            self.section(f"cProfile: {title} время, {len(paths)} дампов")
+            self.stdout.write(f"{'вызовов':>9}{'секунд':>10}  функция")
+            hottest = sorted(
+                stats.items(), key=lambda item: -item[1][key])[:self.top]
+            for (filename, line, function), row in hottest:
+                self.stdout.write(
+                    f"{row[1]:>9}{row[key]:>10.4f}  "
+                    f"{function} ({filename}:{line})")
+
+    def report_stacks(self, paths):
+        own = Counter()
+        total = Counter()
+        samples = 0
+        for path in paths:
+            with open(path) as folded:
+                for line in folded:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    frames = stack.split(";")
+                    count = int(count)
+                    samples += count
+                    own[frames[-1]] += count
+                    for frame in set(frames):
+                        total[frame] += count
+        for counter, title in ((own, "собственное"), (total, "полное")):
+            self.section(
+                f"Стеки: {title} время, {samples} замеров из "
+                f"{len(paths)} снимков")
+            self.stdout.write(f"{'доля':>7}{'секунд':>10}  функция")
+            for frame, count in counter.most_common(self.top):
+                self.stdout.write(
+                    f"{count / samples:>7.1%}"
+                    f"{count * settings.PROFILING_INTERVAL:>10.3f}  {frame}")
+
+    def report_sql(self, snapshots):
+        seconds = Counter()
+        calls = Counter()
+        for _, meta in snapshots:
+            for query in meta["sql"]:
+                sql = normalize_sql(query["sql"])
+                seconds[sql] += query["seconds"]
+                calls[sql] += 1
+        if not calls:
+            return
+        self.section("SQL")
+        self.stdout.write(f"{'вызовов':>9}{'секунд':>10}  запрос")
+        for sql, total in seconds.most_common(self.top):
+            self.stdout.write(f"{calls[sql]:>9}{total:>10.4f}  {sql}")
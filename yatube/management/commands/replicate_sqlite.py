@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import tempfile
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube.db.router import PRIMARY, replicas, report_synced
+
+
+def copy_database(source, target):
+    """Согласованная копия базы source в target через backup API."""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Локальная репликация SQLite для разработки: раз в --interval "
+        "секунд снимает копию default и через --delay секунд переносит "
+        "её в файлы реплик из DATABASES, сообщая роутеру, до какого "
+        "момента реплики содержат данные. --delay имитирует отставание. "
+        "Роутер читает эти отметки из кэша, поэтому кэш должен быть общим "
+        "с сервером (CACHE_BACKEND=sqlite, не locmem)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=1)
+        parser.add_argument(
+            "--delay", type=float, default=0,
+            help="Искусственное отставание реплик в секундах.")
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Одна копия вместо бесконечного цикла.")
+        parser.add_argument(
+            "--source", help="Файл основной базы вместо default.")
+        parser.add_argument(
+            "--replica", action="append", metavar="ALIAS=FILE",
+            help="Реплика вместо баз из DATABASES (можно повторять).")
+
+    def handle(self, *args, **options):
+        source = options["source"] or settings.DATABASES[PRIMARY]["NAME"]
+        targets = self.targets(options["replica"])
+        if not targets:
+            raise CommandError("В DATABASES нет реплик SQLite.")
+        if isinstance(cache, LocMemCache):
+            self.stderr.write(
+                "Кэш locmem не виден серверу: роутер не узнает о "
+                "репликации и будет читать только default.")
+        directory = tempfile.mkdtemp(prefix="replicate-")
+        pending = deque()
+        try:
+            while True:
+                taken_at = time.time()
+                snapshot = os.path.join(directory, f"{time.time_ns()}.db")
+                copy_database(source, snapshot)
+                pending.append((taken_at, snapshot))
+                time.sleep(options["delay"] if options["once"]
+                           else options["interval"])
+                now = time.time()
+                while pending and pending[0][0] + options["delay"] <= now:
+                    self.publish(*pending.popleft(), targets)
+                if options["once"]:
+                    break
+        finally:
+            for _, snapshot in pending:
+                os.remove(snapshot)
+            os.rmdir(directory)
+
+    def targets(self, specs):
+        if specs:
+            return dict(spec.split("=", 1) for spec in specs)
+        return {
+            alias: settings.DATABASES[alias]["NAME"] for alias in replicas()
+            if "sqlite3" in settings.DATABASES[alias]["ENGINE"]
+        }
+
+    def publish(self, taken_at, snapshot, targets):
+        for alias, target in targets.items():
+            copy_database(snapshot, target)
+            report_synced(alias, taken_at)
+        os.remove(snapshot)
+        moment = time.strftime("%H:%M:%S", time.localtime(taken_at))
+        self.stdout.write(f"Реплики получили данные на {moment}")
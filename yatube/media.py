@@ -0,0 +1,187 @@
+"""
+Отдача загруженных и статических файлов.
+
+Файл не читается в воркере целиком: ответ поддерживает условный GET
+(ETag из времени изменения и размера, Last-Modified), диапазоны Range
+для докачки и перемотки, а если перед Django стоит веб-сервер,
+MEDIA_SENDFILE передаёт ему отправку байтов:
+
+- "x-sendfile" (Apache mod_xsendfile, lighttpd) - заголовок X-Sendfile
+  с путём к файлу на диске;
+- "x-accel-redirect" (nginx) - заголовок X-Accel-Redirect с адресом
+  SENDFILE_ACCEL_PREFIX + путь запроса, например /internal/media/...
+  Для него в nginx нужны internal-location'ы с alias на MEDIA_ROOT
+  и STATIC_ROOT.
+
+Без них полный файл отдаёт FileResponse через wsgi.file_wrapper
+(gunicorn и uWSGI отправляют его sendfile), а диапазон - потоком
+кусками по FILE_CHUNK_SIZE.
+
+Статика с хешем содержимого в имени (ManifestStorage) кэшируется
+браузером на год как неизменяемая, остальная и загрузки - на
+MEDIA_CACHE_MAX_AGE и STATIC_CACHE_MAX_AGE секунд.
+"""
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage,
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+FILE_CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ManifestStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хешем содержимого в именах. Файл, которого нет в
+    манифесте, отдаётся под исходным именем, а не роняет страницу.
+    """
+    manifest_strict = False
+
+
+@lru_cache(maxsize=None)
+def _hashed_names():
+    # Манифест меняется только с выкладкой, а с ней и воркеры.
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {})
+                     .values())
+
+
+def byte_range(header, size):
+    """
+    (первый, последний байт) единственного диапазона из Range или
+    None, если отдавать нужно весь файл: заголовка нет, он
+    некорректен или в нём несколько диапазонов. ValueError - диапазон
+    за концом файла.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: последние N байт.
+        if int(last) == 0:
+            raise ValueError("Пустой диапазон")
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise ValueError("Диапазон за концом файла")
+    if last < first:
+        return None
+    return first, last
+
+
+def _read(path, first, length):
+    with open(path, "rb") as file:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _if_range_passes(request, etag, last_modified):
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve(request, path, document_root, max_age, immutable=False):
+    """Файл path из document_root, который браузер хранит max_age секунд."""
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404("Файл не найден")
+    if not os.path.isfile(fullpath):
+        raise Http404("Файл не найден")
+    size = stat.st_size
+    etag = '"{:x}-{:x}"'.format(stat.st_mtime_ns, size)
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(fullpath)[0]
+    content_type = content_type or "application/octet-stream"
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, fullpath, size, content_type,
+                                  etag, last_modified)
+    response["Accept-Ranges"] = "bytes"
+    if response.status_code == 416:
+        return response
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if immutable:
+        patch_cache_control(response, public=True, max_age=max_age,
+                            immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def _file_response(request, fullpath, size, content_type, etag,
+                   last_modified):
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile:
+        # Диапазоны и отправку байтов берёт на себя веб-сервер.
+        response = HttpResponse(content_type=content_type)
+        if sendfile == "x-accel-redirect":
+            response["X-Accel-Redirect"] = (
+                settings.SENDFILE_ACCEL_PREFIX.rstrip("/")
+                + quote(request.path))
+        else:
+            response["X-Sendfile"] = fullpath
+        return response
+
+    try:
+        bounds = byte_range(request.META.get("HTTP_RANGE", ""), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    if bounds is None or not _if_range_passes(request, etag, last_modified):
+        return FileResponse(open(fullpath, "rb"), content_type=content_type)
+    first, last = bounds
+    length = last - first + 1
+    response = StreamingHttpResponse(
+        _read(fullpath, first, length), status=206,
+        content_type=content_type)
+    response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response["Content-Length"] = str(length)
+    return response
+
+
+def media(request, path):
+    """Загруженные файлы: картинки постов и их миниатюры."""
+    return serve(request, path, settings.MEDIA_ROOT,
+                 settings.MEDIA_CACHE_MAX_AGE)
+
+
+def static(request, path):
+    """Собранная collectstatic статика."""
+    if path in _hashed_names():
+        return serve(request, path, settings.STATIC_ROOT,
+                     IMMUTABLE_MAX_AGE, immutable=True)
+    return serve(request, path, settings.STATIC_ROOT,
+                 settings.STATIC_CACHE_MAX_AGE)
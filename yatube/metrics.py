@@ -0,0 +1,229 @@
+"""
+Метрики производительности по страницам в формате Prometheus.
+
+MetricsMiddleware для каждого запроса считает по имени страницы из
+urls (index, profile, post, ...): число запросов и коды ответов,
+гистограмму времени ответа, число и время SQL-запросов, попадания и
+промахи кэша страниц и фрагментов (сигнал posts.cache.cache_accessed)
+и время отрисовки шаблонов (бэкенд TimedDjangoTemplates). Счётчики
+живут в памяти процесса: каждый воркер отдаёт свои, а суммирует их
+Prometheus. Внутренний адрес /metrics/ открыт по токену
+METRICS_TOKEN или явно перечисленным адресам METRICS_ALLOWED_IPS
+(по умолчанию - никаким).
+"""
+import hmac
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+from posts.cache import cache_accessed
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса."""
+    __slots__ = ("queries", "query_seconds", "template_seconds", "cache")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.cache = Counter()
+
+
+class Registry:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.histograms = defaultdict(
+                lambda: [0] * (len(self.buckets) + 1))
+            self.seconds = Counter()
+            self.queries = Counter()
+            self.query_seconds = Counter()
+            self.template_seconds = Counter()
+            self.cache = Counter()
+
+    def observe(self, view, status, seconds, measured):
+        bucket = next(
+            (index for index, bound in enumerate(self.buckets)
+             if seconds <= bound),
+            len(self.buckets),
+        )
+        with self.lock:
+            self.requests[view, str(status)] += 1
+            self.histograms[view][bucket] += 1
+            self.seconds[view] += seconds
+            self.queries[view] += measured.queries
+            self.query_seconds[view] += measured.query_seconds
+            self.template_seconds[view] += measured.template_seconds
+            for (name, result), count in measured.cache.items():
+                self.cache[view, name, result] += count
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples):
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        with self.lock:
+            family("yatube_requests_total", "counter",
+                   "Запросы по странице и коду ответа.",
+                   [((("view", view), ("status", status)), count)
+                    for (view, status), count in self.requests.items()])
+            lines.append("# HELP yatube_request_duration_seconds "
+                         "Время ответа страницы.")
+            lines.append("# TYPE yatube_request_duration_seconds histogram")
+            for view, counts in sorted(self.histograms.items()):
+                total = 0
+                bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, counts):
+                    total += count
+                    lines.append(
+                        "yatube_request_duration_seconds_bucket"
+                        f"{_labels((('view', view), ('le', bound)))} {total}")
+                lines.append("yatube_request_duration_seconds_sum"
+                             f"{_labels((('view', view),))} "
+                             f"{self.seconds[view]}")
+                lines.append("yatube_request_duration_seconds_count"
+                             f"{_labels((('view', view),))} {total}")
+            for name, help_text, counter in (
+                ("yatube_db_queries_total", "SQL-запросы страницы.",
+                 self.queries),
+                ("yatube_db_query_seconds_total",
+                 "Время SQL-запросов страницы.", self.query_seconds),
+                ("yatube_template_render_seconds_total",
+                 "Время отрисовки шаблонов страницы.",
+                 self.template_seconds),
+            ):
+                family(name, "counter", help_text,
+                       [((("view", view),), value)
+                        for view, value in counter.items()])
+            family("yatube_cache_requests_total", "counter",
+                   "Обращения к кэшу страниц и фрагментов.",
+                   [((("view", view), ("cache", name), ("result", result)),
+                     count)
+                    for (view, name, result), count in self.cache.items()])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs):
+    return "{" + ",".join(
+        f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+registry = Registry(settings.METRICS_BUCKETS)
+
+
+def _time_query(execute, sql, params, many, context):
+    measured = _current.get()
+    if measured is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measured.queries += 1
+        measured.query_seconds += time.perf_counter() - started
+
+
+@receiver(cache_accessed)
+def _count_cache(sender, name, hit, **kwargs):
+    measured = _current.get()
+    if measured is not None:
+        measured.cache[name, "hit" if hit else "miss"] += 1
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unresolved"
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        measured = RequestMetrics()
+        token = _current.set(measured)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.observe(view_name(request), response.status_code,
+                         time.perf_counter() - started, measured)
+        return response
+
+
+class TimedTemplate:
+    """Шаблон, который прибавляет время отрисовки к замерам запроса."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            measured = _current.get()
+            if measured is not None:
+                measured.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, шаблоны которого замеряют время отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _allowed(request):
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", "").encode(),
+        f"Bearer {token}".encode())
+
+
+def metrics(request):
+    """Внутренняя страница с метриками в текстовом формате Prometheus."""
+    if not _allowed(request):
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,186 @@
+"""
+Профилирование медленных запросов.
+
+ProfilingMiddleware включается настройками и без них не участвует
+в обработке запросов:
+
+* PROFILING_SAMPLE_RATE - доля запросов, которые целиком проходят
+  под cProfile; дамп .prof читают pstats, snakeviz и flameprof;
+* PROFILING_SLOW_THRESHOLD - порог в секундах: пока запрос идёт,
+  фоновый поток раз в PROFILING_INTERVAL снимает его стек, и если
+  запрос не уложился в порог, стеки сохраняются в свёрнутом формате
+  flamegraph.pl (.folded), иначе выбрасываются.
+
+Рядом с дампом пишется .json с именем страницы, id пользователя,
+временем ответа и журналом SQL. В PROFILING_DIR хранится не больше
+PROFILING_MAX_DUMPS снимков, старые удаляются. Сводку по снимкам
+строит команда profile_report.
+"""
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from yatube.metrics import view_name
+
+
+def fold(frame):
+    """Стек от корня к frame в формате flamegraph.pl."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Фоновый поток, снимающий стеки наблюдаемых потоков. Пока
+    наблюдать некого, поток спит на условии и не просыпается.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wanted = threading.Condition(self.lock)
+        self.watched = {}
+        self.thread = None
+
+    def watch(self, thread_id):
+        stacks = Counter()
+        with self.lock:
+            self.watched[thread_id] = stacks
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="profiling-sampler", daemon=True)
+                self.thread.start()
+            self.wanted.notify()
+        return stacks
+
+    def unwatch(self, thread_id):
+        with self.lock:
+            self.watched.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.wanted.wait_for(lambda: self.watched)
+            time.sleep(self.interval)
+            with self.lock:
+                frames = sys._current_frames()
+                for thread_id, stacks in self.watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[fold(frame)] += 1
+
+
+class QueryLog(list):
+    """Журнал SQL запроса: текст и время каждого выполнения."""
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.append({
+                "sql": sql,
+                "seconds": round(time.perf_counter() - started, 6),
+            })
+
+
+def rotate(directory, keep):
+    """Оставляет в directory только keep последних снимков."""
+    snapshots = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in snapshots[:max(len(snapshots) - keep, 0)]:
+        base = entry.path[:-len(".json")]
+        for extension in (".json", ".prof", ".folded"):
+            if os.path.exists(base + extension):
+                os.remove(base + extension)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not (settings.PROFILING_SAMPLE_RATE
+                or settings.PROFILING_SLOW_THRESHOLD):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sampler = StackSampler(settings.PROFILING_INTERVAL)
+
+    def __call__(self, request):
+        queries = QueryLog()
+        profiler = stacks = None
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # В процессе уже работает другой профилировщик.
+                profiler = None
+        if profiler is None and settings.PROFILING_SLOW_THRESHOLD:
+            stacks = self.sampler.watch(threading.get_ident())
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            seconds = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+            if stacks is not None:
+                self.sampler.unwatch(threading.get_ident())
+        slow = (settings.PROFILING_SLOW_THRESHOLD
+                and seconds >= settings.PROFILING_SLOW_THRESHOLD)
+        if profiler is not None or slow:
+            self.save(request, response, seconds, queries, profiler, stacks)
+        return response
+
+    def save(self, request, response, seconds, queries, profiler, stacks):
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        view = view_name(request)
+        user = getattr(request, "user", None)
+        user_id = getattr(user, "pk", None)
+        base = os.path.join(directory, "{}-{}-{}-u{}-{}ms".format(
+            time.strftime("%Y%m%d-%H%M%S"),
+            f"{time.time_ns() % 10 ** 9:09d}",
+            view.replace(":", "_"),
+            user_id or 0,
+            round(seconds * 1000),
+        ))
+        if profiler is not None:
+            profiler.dump_stats(base + ".prof")
+            kind = "cprofile"
+        else:
+            with open(base + ".folded", "w") as folded:
+                for stack, count in stacks.items():
+                    folded.write(f"{stack} {count}\n")
+            kind = "stacks"
+        with open(base + ".json", "w") as meta:
+            json.dump({
+                "view": view,
+                "user_id": user_id,
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "seconds": round(seconds, 6),
+                "kind": kind,
+                "sql": queries,
+            }, meta, ensure_ascii=False, indent=1)
+        rotate(directory, settings.PROFILING_MAX_DUMPS)
@@ -53,10 +53,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
+    'yatube',
 ]
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.profiling.ProfilingMiddleware',
+    'yatube.db.router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,15 +67,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# debug_toolbar замедляет каждый запрос, поэтому только для разработки
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, замеряющий время отрисовки для yatube.metrics
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,6 +90,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'users.context_processors.year',
+                'posts.context_processors.card_cache',
             ],
         },
     },
@@ -93,12 +102,35 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Без переменных окружения - SQLite в режиме WAL (yatube.db.sqlite3).
+# DB_REPLICAS - через запятую имена файлов SQLite или хосты реплик
+# остальных СУБД; на них уходят чтения лент (yatube.db.router).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': os.getenv('DB_ENGINE', 'yatube.db.sqlite3'),
+        'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(','))):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        ('NAME' if 'sqlite3' in DATABASES['default']['ENGINE']
+         else 'HOST'): replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['yatube.db.router.ReplicaRouter']
+# Страницы (имена url), которые читают с реплик, допустимое отставание
+# реплики в секундах и сколько после записи пользователь читает
+# default; срок не меньше отставания гарантирует, что он видит своё
+REPLICA_VIEWS = ('index', 'group', 'profile', 'users', 'groups')
+REPLICA_MAX_LAG = 5
+REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -134,12 +166,64 @@ USE_L10N = True
 
 USE_TZ = True
 
-CACHES = {
-    'default': {
+# CACHE_BACKEND=sqlite включает общий для всех воркеров хоста кэш
+# в файле SQLite с вытеснением LRU (yatube.cache_backends.SQLiteCache)
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'yatube.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+            'MAX_SIZE': int(os.getenv('CACHE_MAX_SIZE', 512 * 1024 ** 2)),
+        },
+    },
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
 }
 
+# Страницы лент кэшируются с версионными ключами (posts.cache) и
+# инвалидируются сигналами через поколения в кэше. В общем кэше
+# поколения видят все воркеры, и TTL может быть долгим. В locmem
+# у каждого процесса свои поколения, и запись, сделанную в другом
+# процессе, он замечает, только когда его поколение истечёт, поэтому
+# они живут GENERATION_TIMEOUT секунд, а страницы - не дольше них.
+# Для нескольких воркеров нужен CACHE_BACKEND=sqlite.
+GENERATION_TIMEOUT = None if CACHE_BACKEND == 'sqlite' else 20
+PAGE_CACHE_TIMEOUT = GENERATION_TIMEOUT or 3 * 60 * 60
+# Защита от лавины промахов: сколько ещё хранить устаревшую копию
+# для отдачи во время пересчёта, сколько держать блокировку пересчёта
+# и сколько ждать её снятия, если копии нет
+CACHE_STALE_TIMEOUT = 5 * 60
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 2
+# Коэффициент вероятностного раннего обновления (XFetch), 0 - выключено
+CACHE_EARLY_REFRESH_BETA = 1.0
+
+# Карточка поста кэшируется по его версии (Post.version) и
+# переиспользуется всеми лентами
+CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Лента подписок: при большем числе подписчиков посты автора
+# не раскладываются по лентам, а подмешиваются при чтении
+FEED_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL_LIMIT = 1000
+FEED_BATCH_SIZE = 1000
+# Сколько последних постов хранит лента; переполненные ленты обрезает
+# команда trim_feeds, которую стоит запускать по расписанию
+FEED_MAX_ENTRIES = 3000
+
+# Каталог групп: за сколько дней считать активность и сколько секунд
+# страница группы держит группу в памяти процесса
+GROUP_ACTIVITY_DAYS = 7
+GROUP_CACHE_TIMEOUT = 60
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
@@ -149,6 +233,40 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Без DEBUG статика получает хеш содержимого в именах (collectstatic)
+# и кэшируется браузером на год
+if not DEBUG:
+    STATICFILES_STORAGE = 'yatube.media.ManifestStorage'
+
+# Отдача файлов yatube.media: "x-sendfile" или "x-accel-redirect"
+# передают её веб-серверу, пусто - Django сам. Для nginx
+# X-Accel-Redirect ведёт на SENDFILE_ACCEL_PREFIX + адрес файла.
+# Сколько секунд браузер хранит загрузки и статику без хеша в имени
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '').lower()
+SENDFILE_ACCEL_PREFIX = '/internal/'
+MEDIA_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+STATIC_CACHE_MAX_AGE = 60 * 60
+
+# Миниатюры, которые готовит posts.thumbnails: псевдоним для шаблонов,
+# геометрия и параметры sorl-thumbnail
+THUMBNAIL_SIZES = {
+    'card': ('960x600', {'crop': 'center', 'upscale': True}),
+    'image': ('1020x600', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = 2
+
+# Картинки постов пишутся на диск кусками, и больше
+# POST_IMAGE_MAX_UPLOAD_SIZE отклоняются, не дочитываясь в файл
+# (posts.uploadhandlers.bounded_uploads на страницах записи)
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 ** 2
+# Защита от "бомб распаковки": предел числа пикселей по заголовку
+POST_IMAGE_MAX_PIXELS = 50 * 1000 ** 2
+# Картинка уменьшается до этих размеров и перекодируется в первый
+# формат, который поддерживает установленный Pillow
+POST_IMAGE_MAX_SIZE = (2048, 2048)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POST_IMAGE_QUALITY = 80
+
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index" 
 # LOGOUT_REDIRECT_URL = "index"  
@@ -157,3 +275,32 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
+
+# Метрики yatube.metrics: границы гистограммы времени ответа в секундах
+# и кому доступен /metrics/ - по заголовку
+# "Authorization: Bearer <METRICS_TOKEN>" или адресам из
+# METRICS_ALLOWED_IPS (через запятую). Список по умолчанию пуст: за
+# прокси на том же хосте все клиенты приходят с 127.0.0.1
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',')
+    if ip.strip()
+]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Профилирование yatube.profiling, по умолчанию выключено: доля запросов
+# под cProfile и порог в секундах, после которого сохраняются стеки,
+# снятые раз в PROFILING_INTERVAL секунд
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_SLOW_THRESHOLD = float(os.getenv("PROFILING_SLOW_THRESHOLD", 0))
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = os.getenv(
+    "PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILING_MAX_DUMPS = 200
+
+# Полнотекстовый поиск (posts.search): "auto" выбирает FTS5 на SQLite
+# и индекс в таблице PostTerm на остальных базах
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_MAX_RESULTS = 1000
+# Сколько постов с самой редкой основой запроса ранжирует PostTerm
+SEARCH_MAX_CANDIDATES = 10000
@@ -0,0 +1,419 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from yatube.cache_backends import SQLiteCache
+from yatube.db.router import (
+    PIN_COOKIE, SYNCED_KEY, ReplicaMiddleware, ReplicaRouter, report_synced,
+    stale_read,
+)
+from yatube.metrics import registry
+from yatube.profiling import StackSampler
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get(self):
+        """Значения сохраняются и видны другому экземпляру кэша."""
+        self.cache.set('ключ', {'страница': 1})
+        self.assertEqual(self.make_cache().get('ключ'), {'страница': 1})
+        self.assertEqual(
+            self.cache.get_many(['ключ', 'нет']), {'ключ': {'страница': 1}})
+
+    def test_expiry(self):
+        """Просроченные значения не отдаются."""
+        self.cache.set('ключ', 1, 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('ключ'))
+        self.assertFalse(self.cache.has_key('ключ'))
+
+    def test_add_and_incr(self):
+        """add не перезаписывает живое значение, incr атомарно растёт."""
+        self.assertTrue(self.cache.add('счётчик', 1))
+        self.assertFalse(self.cache.add('счётчик', 5))
+        self.assertEqual(self.cache.incr('счётчик', 2), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('нет')
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for key in 'abc':
+            cache.set(key, key)
+        cache._db.execute("UPDATE cache SET accessed = 0 WHERE key = 'a'")
+        cache.set('d', 'd')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get_many(['b', 'c', 'd']),
+                         {'b': 'b', 'c': 'c', 'd': 'd'})
+
+    def test_size_bound(self):
+        """Суммарный объём значений не превышает MAX_SIZE."""
+        cache = self.make_cache(MAX_SIZE=10000)
+        for number in range(20):
+            cache.set(number, b'x' * 1000)
+        size = cache._db.execute(
+            'SELECT size FROM cache_totals').fetchone()[0]
+        self.assertLessEqual(size, 10000)
+        self.assertIsNotNone(cache.get(19))
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.connections = ConnectionHandler({'default': {
+            'ENGINE': 'yatube.db.sqlite3',
+            'NAME': os.path.join(self.directory, 'db.sqlite3'),
+            'OPTIONS': {'pragmas': {'busy_timeout': 1000}},
+        }})
+        self.connection = self.connections['default']
+
+    def tearDown(self):
+        self.connections.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        """При подключении включаются WAL и настройки из OPTIONS."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 1000)
+        self.assertGreater(self.pragma('mmap_size'), 0)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+
+    def test_immediate_transactions(self):
+        """Транзакция сразу берёт блокировку на запись."""
+        with CaptureQueriesContext(self.connection) as queries:
+            self.connection._start_transaction_under_autocommit()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        with self.connection.cursor() as cursor:
+            cursor.execute('ROLLBACK')
+
+
+@patch('yatube.db.router.replicas', return_value=['replica0'])
+class ReplicaRouterTest(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, url, cookies=None, write=False):
+        """(база чтения, устарела ли реплика, ответ) для запроса url."""
+        request = self.factory.get(url)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(url)
+        seen = {}
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            seen['read'] = self.router.db_for_read(User)
+            seen['stale'] = stale_read()
+            if write:
+                self.assertEqual(self.router.db_for_write(User), 'default')
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        response = middleware(request)
+        return seen['read'], seen['stale'], response
+
+    def test_feed_reads(self, replicas):
+        """Ленты читают свежую реплику, остальные страницы - default."""
+        report_synced('replica0', time.time())
+        self.assertEqual(self.route(reverse('index'))[:2],
+                         ('replica0', False))
+        self.assertEqual(self.route(reverse('new_post'))[0], 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertFalse(self.router.allow_migrate('replica0', 'posts'))
+
+    def test_lagging_replica(self, replicas):
+        """Реплика, отстающая дольше REPLICA_MAX_LAG, не используется."""
+        self.assertEqual(self.route(reverse('index'))[0], 'default')
+        report_synced('replica0', time.time() - 60)
+        self.assertEqual(self.route(reverse('index'))[0], 'default')
+        with self.settings(REPLICA_MAX_LAG=None):
+            self.assertEqual(self.route(reverse('index'))[0], 'replica0')
+
+    def test_read_your_writes(self, replicas):
+        """После записи пользователь читает default, а кэш - не реплику."""
+        report_synced('replica0', time.time() - 1)
+        response = self.route(reverse('new_post'), write=True)[2]
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertEqual(
+            self.route(reverse('index'), {PIN_COOKIE: cookie.value})[0],
+            'default')
+        # Реплика ещё не получила запись: страницу нельзя кэшировать.
+        self.assertEqual(self.route(reverse('index'))[:2], ('replica0', True))
+        report_synced('replica0', time.time())
+        self.assertEqual(self.route(reverse('index'))[1], False)
+
+
+class ReplicateSQLiteTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        cache.clear()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_replicate(self):
+        """Команда копирует базу в реплику и сообщает время копии."""
+        with sqlite3.connect(self.path('primary.sqlite3')) as primary:
+            primary.execute('CREATE TABLE post (text)')
+            primary.execute("INSERT INTO post VALUES ('запись')")
+        primary.close()
+        started = time.time()
+        call_command(
+            'replicate_sqlite', once=True, delay=0.01,
+            source=self.path('primary.sqlite3'),
+            replica=[f'replica0={self.path("replica.sqlite3")}'],
+            stdout=StringIO(), stderr=StringIO())
+        replica = sqlite3.connect(self.path('replica.sqlite3'))
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT text FROM post').fetchall(),
+            [('запись',)])
+        synced = cache.get(SYNCED_KEY.format('replica0'))
+        self.assertGreaterEqual(synced, started)
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = Client()
+
+    def test_page_metrics(self):
+        """Страница считается по имени url вместе с SQL, кэшем и шаблонами."""
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        text = self.client.get(
+            reverse('metrics'),
+            HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        for line in (
+            'yatube_requests_total{view="index",status="200"} 2',
+            'yatube_request_duration_seconds_count{view="index"} 2',
+            'yatube_cache_requests_total'
+            '{view="index",cache="index_page",result="hit"} 1',
+            'yatube_cache_requests_total'
+            '{view="index",cache="index_page",result="miss"} 1',
+        ):
+            self.assertIn(line, text)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="index",le="+Inf"} 2', text)
+        self.assertRegex(
+            text, r'yatube_db_queries_total\{view="index"\} [1-9]')
+        self.assertRegex(
+            text, r'yatube_template_render_seconds_total'
+                  r'\{view="index"\} 0\.0*[1-9]')
+
+    def test_internal_only(self):
+        """Метрики закрыты без токена, даже для 127.0.0.1 за прокси."""
+        url = reverse('metrics')
+        for address in ('10.0.0.1', '127.0.0.1'):
+            with self.subTest(address=address):
+                self.assertEqual(self.client.get(
+                    url, REMOTE_ADDR=address).status_code, 404)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1',
+                                   HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.2']):
+            self.assertEqual(self.client.get(
+                url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='profiled')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def get(self, url, **settings):
+        """Запрос новым клиентом: middleware собираются при первом вызове."""
+        with self.settings(PROFILING_DIR=self.directory, **settings):
+            client = Client()
+            client.force_login(self.user)
+            return client.get(url)
+
+    def dumps(self, extension):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(extension))
+
+    def test_sampled_request(self):
+        """Выбранный запрос сохраняется дампом cProfile и журналом SQL."""
+        self.get(reverse('index'), PROFILING_SAMPLE_RATE=1)
+        self.assertEqual(len(self.dumps('.prof')), 1)
+        [name] = self.dumps('.json')
+        self.assertIn(f'-index-u{self.user.pk}-', name)
+        with open(os.path.join(self.directory, name)) as meta_file:
+            meta = json.load(meta_file)
+        self.assertEqual(meta['view'], 'index')
+        self.assertEqual(meta['user_id'], self.user.pk)
+        self.assertEqual(meta['kind'], 'cprofile')
+        self.assertTrue(meta['sql'])
+
+    def test_slow_request(self):
+        """Стеки сохраняются только для запросов дольше порога."""
+        self.get(reverse('index'), PROFILING_SLOW_THRESHOLD=60)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.get(reverse('index'), PROFILING_SLOW_THRESHOLD=1e-9)
+        self.assertEqual(len(self.dumps('.folded')), 1)
+        self.assertEqual(self.dumps('.prof'), [])
+
+    def test_idle_sampler_sleeps(self):
+        """Без наблюдаемых запросов поток ждёт на условии, а не опрашивает."""
+        sampler = StackSampler(0.001)
+        stacks = sampler.watch(threading.get_ident())
+        deadline = time.monotonic() + 5
+        while not stacks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(stacks)
+        sampler.unwatch(threading.get_ident())
+        time.sleep(0.05)
+        frame = sys._current_frames()[sampler.thread.ident]
+        self.assertEqual(frame.f_code.co_name, 'wait')
+
+    def test_rotation_and_report(self):
+        """Старые снимки удаляются, а отчёт складывает оставшиеся."""
+        for _ in range(3):
+            self.get(reverse('groups'), PROFILING_SAMPLE_RATE=1,
+                     PROFILING_MAX_DUMPS=2)
+        self.assertEqual(len(self.dumps('.json')), 2)
+        self.assertEqual(len(self.dumps('.prof')), 2)
+        out = StringIO()
+        call_command('profile_report', dir=self.directory, top=5,
+                     stdout=out)
+        report = out.getvalue()
+        self.assertRegex(report, r'groups\s+2\s')
+        self.assertIn('cProfile', report)
+        self.assertIn('SELECT', report)
+
+
+class MediaServeTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.content = bytes(range(256)) * 4
+        os.makedirs(os.path.join(self.directory, 'posts'))
+        with open(os.path.join(self.directory, 'posts', 'a.jpg'), 'wb') as f:
+            f.write(self.content)
+        self.url = '/media/posts/a.jpg'
+        settings = self.settings(MEDIA_ROOT=self.directory,
+                                 MEDIA_SENDFILE='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_full_and_not_modified(self):
+        """Файл отдаётся целиком с валидаторами, повтор - 304."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=2592000', response['Cache-Control'])
+        again = self.client.get(self.url,
+                                HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_ranges(self):
+        """Диапазоны Range отдаются частично, недостижимый - 416."""
+        cases = {
+            'bytes=10-19': (self.content[10:20], 'bytes 10-19/1024'),
+            'bytes=1000-': (self.content[1000:], 'bytes 1000-1023/1024'),
+            'bytes=-4': (self.content[-4:], 'bytes 1020-1023/1024'),
+        }
+        for header, (body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range(self):
+        """Устаревший If-Range отменяет диапазон."""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+                                   HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+                                   HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile(self):
+        """С MEDIA_SENDFILE байты отправляет веб-сервер."""
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/internal/media/posts/a.jpg')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'],
+                         os.path.join(self.directory, 'posts', 'a.jpg'))
+
+    def test_outside_root(self):
+        """Пути вне MEDIA_ROOT и каталоги не отдаются."""
+        for url in ('/media/../settings.py', '/media/posts/',
+                    '/media/missing.jpg'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_hashed_static(self):
+        """Статика с хешем в имени кэшируется как неизменяемая."""
+        for name in ('app.css', 'app.0a1b2c.css'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write('body {}')
+        with self.settings(STATIC_ROOT=self.directory), patch(
+                'yatube.media._hashed_names',
+                return_value={'app.0a1b2c.css'}):
+            plain = self.client.get('/static/app.css')
+            hashed = self.client.get('/static/app.0a1b2c.css')
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(hashed['Cache-Control'],
+                         'public, max-age=31536000, immutable')
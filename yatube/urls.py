@@ -1,11 +1,11 @@
-from django.views.static import serve
 from django.conf import settings
 from django.conf.urls import handler400, handler500, url  # noqa
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from yatube import media, metrics
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -19,24 +19,19 @@ urlpatterns = [
     path("terms/", views.flatpage, {"url": "/terms/"}, name="terms"),
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
+    path("metrics/", metrics.metrics, name="metrics"),
     path("", include("posts.urls")),
 
 ]
 
+# Без веб-сервера перед Django; с ним байты отправляет он сам
+# (MEDIA_SENDFILE, см. yatube.media)
 urlpatterns += [
-    url(r'^media/(?P<path>.*)$', serve,
-        {'document_root': settings.MEDIA_ROOT}),
-    url(r'^static/(?P<path>.*)$', serve,
-        {'document_root': settings.STATIC_ROOT}),
+    url(r'^media/(?P<path>.*)$', media.media, name='media'),
+    url(r'^static/(?P<path>.*)$', media.static, name='static'),
 ]
 
 if settings.DEBUG:
     import debug_toolbar
 
     urlpatterns += (path("__debug__/", include(debug_toolbar.urls)),)
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(
-        settings.STATIC_URL,
-        document_root=settings.STATIC_ROOT)